@@ -0,0 +1,47 @@
+"""Add item filter indexes
+
+Revision ID: 3c8d5a6f2e71
+Revises: 7b2f4e9c1d3a
+Create Date: 2026-10-18 13:41:07.502913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8d5a6f2e71'
+down_revision = '7b2f4e9c1d3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Indexes backing the filters of GET /items/
+    op.create_index(op.f('ix_item_current_owner_id'), 'item', ['current_owner_id'])
+    op.create_index(op.f('ix_item_current_room'), 'item', ['current_room'])
+    op.create_index(op.f('ix_item_table_name'), 'item', ['table_name'])
+    op.create_index(op.f('ix_item_system_name'), 'item', ['system_name'])
+    # Partial indexes in the listing's sort order for available and taken items
+    op.create_index(
+        'ix_item_available_item_name_item_id',
+        'item',
+        ['item_name', 'item_id'],
+        postgresql_where=sa.text('is_available'),
+    )
+    op.create_index(
+        'ix_item_taken_item_name_item_id',
+        'item',
+        ['item_name', 'item_id'],
+        postgresql_where=sa.text('NOT is_available'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_item_taken_item_name_item_id', table_name='item')
+    op.drop_index('ix_item_available_item_name_item_id', table_name='item')
+    op.drop_index(op.f('ix_item_system_name'), table_name='item')
+    op.drop_index(op.f('ix_item_table_name'), table_name='item')
+    op.drop_index(op.f('ix_item_current_room'), table_name='item')
+    op.drop_index(op.f('ix_item_current_owner_id'), table_name='item')
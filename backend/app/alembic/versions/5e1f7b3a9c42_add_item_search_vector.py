@@ -0,0 +1,51 @@
+"""Add item search vector and indexes
+
+Revision ID: 5e1f7b3a9c42
+Revises: 3c8d5a6f2e71
+Create Date: 2026-10-18 15:02:33.918240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1f7b3a9c42'
+down_revision = '3c8d5a6f2e71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Full-text document of GET /items/search, kept up to date by Postgres
+    op.add_column(
+        'item',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('english'::regconfig, coalesce(item_name, '') || ' ' || "
+                "coalesce(item_vendor, '') || ' ' || coalesce(item_params, ''))",
+                persisted=True,
+            ),
+        ),
+    )
+    op.create_index(
+        'ix_item_search_vector', 'item', ['search_vector'], postgresql_using='gin'
+    )
+    op.create_index(
+        'ix_item_item_name_trgm',
+        'item',
+        ['item_name'],
+        postgresql_using='gin',
+        postgresql_ops={'item_name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade():
+    op.drop_index('ix_item_item_name_trgm', table_name='item')
+    op.drop_index('ix_item_search_vector', table_name='item')
+    op.drop_column('item', 'search_vector')
@@ -0,0 +1,29 @@
+"""Add keyset pagination indexes
+
+Revision ID: 7b2f4e9c1d3a
+Revises: 1a31ce608336
+Create Date: 2026-10-18 09:12:40.118522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2f4e9c1d3a'
+down_revision = '1a31ce608336'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Composite indexes matching the stable sort keys of GET /items/ and
+    # GET /rooms/, so cursor pages are a single index range scan
+    op.create_index('ix_item_item_name_item_id', 'item', ['item_name', 'item_id'])
+    op.create_index('ix_room_room_number_room_id', 'room', ['room_number', 'room_id'])
+
+
+def downgrade():
+    op.drop_index('ix_room_room_number_room_id', table_name='room')
+    op.drop_index('ix_item_item_name_item_id', table_name='item')
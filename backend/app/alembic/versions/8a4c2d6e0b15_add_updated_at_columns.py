@@ -0,0 +1,38 @@
+"""Add updated_at columns
+
+Revision ID: 8a4c2d6e0b15
+Revises: 5e1f7b3a9c42
+Create Date: 2026-10-18 16:20:51.733104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4c2d6e0b15'
+down_revision = '5e1f7b3a9c42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Row versions for ETags. Existing rows start at the migration time, new
+    # values are set by the application on insert and update.
+    for table in ('user', 'item', 'room'):
+        op.add_column(
+            table,
+            sa.Column(
+                'updated_at',
+                sa.DateTime(),
+                nullable=False,
+                server_default=sa.text("timezone('utc', now())"),
+            ),
+        )
+        op.alter_column(table, 'updated_at', server_default=None)
+
+
+def downgrade():
+    for table in ('room', 'item', 'user'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,30 @@
+"""Add revokedtoken table
+
+Revision ID: b6e3f1a8d204
+Revises: 8a4c2d6e0b15
+Create Date: 2026-10-18 21:05:12.418377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e3f1a8d204'
+down_revision = '8a4c2d6e0b15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'revokedtoken',
+        sa.Column('token_id', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('token_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('revokedtoken')
@@ -0,0 +1,46 @@
+"""Add outboxemail table
+
+Revision ID: d7a2c5e94b16
+Revises: c41d9e7f2a58
+Create Date: 2026-10-18 23:58:04.215630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2c5e94b16'
+down_revision = 'c41d9e7f2a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'outboxemail',
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('email_to', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+        sa.Column('subject', sqlmodel.sql.sqltypes.AutoString(length=1000), nullable=False),
+        sa.Column('html_content', sa.Text(), nullable=False),
+        sa.Column('status', sqlmodel.sql.sqltypes.AutoString(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # Only pending emails are polled, dead ones stay out of the index
+    op.create_index(
+        'ix_outboxemail_pending_next_attempt_at',
+        'outboxemail',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_outboxemail_pending_next_attempt_at', table_name='outboxemail')
+    op.drop_table('outboxemail')
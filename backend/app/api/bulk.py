@@ -0,0 +1,185 @@
+import codecs
+import csv
+import json
+from collections import deque
+from collections.abc import AsyncIterable, AsyncIterator
+from typing import Any, Literal
+
+from fastapi import HTTPException
+
+BulkFormat = Literal["csv", "jsonl"]
+
+BULK_CONTENT_TYPES: dict[str, BulkFormat] = {
+    "text/csv": "csv",
+    "application/jsonl": "jsonl",
+    "application/x-ndjson": "jsonl",
+    "application/x-jsonlines": "jsonl",
+}
+
+
+def bulk_format(content_type: str | None) -> BulkFormat:
+    """
+    Pick the body format from a Content-Type header, ignoring its parameters.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type not in BULK_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported Content-Type, use one of {', '.join(BULK_CONTENT_TYPES)}",
+        )
+    return BULK_CONTENT_TYPES[media_type]
+
+
+def _decode_line(line: bytearray, *, first: bool) -> str | None:
+    if first:
+        line = line.removeprefix(codecs.BOM_UTF8)
+    try:
+        return line.decode().rstrip("\r")
+    except UnicodeDecodeError:
+        return None
+
+
+async def iter_lines(
+    chunks: AsyncIterable[bytes], *, max_line_bytes: int
+) -> AsyncIterator[str | None]:
+    """
+    Split a byte stream into lines and decode them as UTF-8, dropping a leading
+    BOM, without holding more than one line and one chunk in memory.
+
+    A line that isn't valid UTF-8 or is longer than `max_line_bytes` comes out
+    as None, and the rest of a long line is skipped rather than buffered.
+    """
+    buffer = bytearray()
+    too_long = False
+    first = True
+    async for chunk in chunks:
+        # A newline byte is never part of a longer UTF-8 character, so lines
+        # can be split before decoding
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if not too_long:
+                buffer += chunk[start:] if end == -1 else chunk[start:end]
+                if len(buffer) > max_line_bytes:
+                    too_long = True
+                    buffer.clear()
+            if end == -1:
+                break
+            yield None if too_long else _decode_line(buffer, first=first)
+            buffer.clear()
+            too_long = False
+            first = False
+            start = end + 1
+    if too_long:
+        yield None
+    elif buffer:
+        yield _decode_line(buffer, first=first)
+
+
+async def _csv_records(
+    lines: AsyncIterator[str | None], *, max_record_lines: int
+) -> AsyncIterator[tuple[int, dict[str, Any] | None]]:
+    header: list[str] | None = None
+    # (line number, line) of the record being read, more than one while a
+    # quoted field spans lines
+    record: list[tuple[int, str]] = []
+    in_quotes = False
+    # Lines to read again, given back by a record whose quote never closed
+    pending: deque[tuple[int, str | None]] = deque()
+    line_number = 0
+
+    def abandon(*retry: tuple[int, str | None]) -> int:
+        """
+        Drop the record, so its first line is the malformed one, and give back
+        its other lines to be read again. Returns the first line's number.
+        """
+        nonlocal in_quotes
+        pending.extendleft(reversed([*record[1:], *retry]))
+        first_line = record[0][0]
+        record.clear()
+        in_quotes = False
+        return first_line
+
+    while True:
+        if pending:
+            number, line = pending.popleft()
+        else:
+            try:
+                line = await anext(lines)
+            except StopAsyncIteration:
+                if not record:
+                    break
+                yield abandon(), None
+                continue
+            line_number += 1
+            number = line_number
+        if line is None:
+            yield (abandon((number, None)) if record else number), None
+            continue
+        if not record and not line.strip():
+            continue
+        record.append((number, line))
+        # Track quote parity line by line, a stray quote can't make this
+        # quadratic
+        if line.count('"') % 2:
+            in_quotes = not in_quotes
+        if in_quotes:
+            if len(record) >= max_record_lines:
+                yield abandon(), None
+            continue
+        record_line = record[0][0]
+        row = next(csv.reader(["\n".join(text for _, text in record)]))
+        record.clear()
+        if header is None:
+            header = [name.strip() for name in row]
+            continue
+        if len(row) != len(header):
+            yield record_line, None
+            continue
+        # Empty cells mean "not given", so model defaults apply
+        yield (
+            record_line,
+            {
+                name: value
+                for name, value in zip(header, row, strict=True)
+                if value != ""
+            },
+        )
+
+
+async def _jsonl_records(
+    lines: AsyncIterator[str | None],
+) -> AsyncIterator[tuple[int, dict[str, Any] | None]]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line is None:
+            yield line_number, None
+            continue
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, value if isinstance(value, dict) else None
+
+
+def iter_records(
+    chunks: AsyncIterable[bytes],
+    fmt: BulkFormat,
+    *,
+    max_line_bytes: int,
+    max_record_lines: int,
+) -> AsyncIterator[tuple[int, dict[str, Any] | None]]:
+    """
+    Yield `(line number, record)` for each row of a CSV (with a header row) or
+    JSON Lines stream. The record is None when the row can't be parsed, which
+    includes lines over `max_line_bytes`, lines that aren't UTF-8, and a CSV
+    quoted field still open after `max_record_lines` lines.
+    """
+    lines = iter_lines(chunks, max_line_bytes=max_line_bytes)
+    if fmt == "csv":
+        return _csv_records(lines, max_record_lines=max_record_lines)
+    return _jsonl_records(lines)
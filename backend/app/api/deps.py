@@ -1,4 +1,5 @@
-from collections.abc import Generator
+import time
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
@@ -7,11 +8,15 @@ from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import crud, crud_async
 from app.core import security
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, engine
+from app.core.revocation import revocations
+from app.models import PERMISSIONS, Principal, TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -23,22 +28,60 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Objects stay loaded after commit: expired attributes can't lazy-load in async
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+# Decoded claims of valid tokens, checking a signature costs more than a lookup
+token_cache: TTLCache[str, TokenPayload] = TTLCache(
+    maxsize=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
+
+
+def decode_access_token(token: str) -> TokenPayload:
+    token_data = token_cache.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+            )
+            token_data = TokenPayload(**payload)
+        except (InvalidTokenError, ValidationError):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        ttl: float = settings.TOKEN_CACHE_TTL_SECONDS
+        if token_data.exp is not None:
+            # Expired tokens must go through jwt.decode again to be rejected
+            ttl = min(ttl, token_data.exp - time.time())
+        token_cache.set(token, token_data, ttl=ttl)
+    if token_data.jti is not None and token_data.jti in revocations:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
         )
-        token_data = TokenPayload(**payload)
-    except (InvalidTokenError, ValidationError):
+    return token_data
+
+
+def token_subject(token_data: TokenPayload) -> str:
+    # Every token is issued with one, reject forged ones before any lookup
+    if token_data.sub is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+    return token_data.sub
+
+
+def check_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,12 +89,50 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    token_data = decode_access_token(token)
+    user_id = token_subject(token_data)
+    return check_user(crud.get_user(session=session, user_id=user_id))
+
+
+async def get_async_current_user(session: AsyncSessionDep, token: TokenDep) -> User:
+    token_data = decode_access_token(token)
+    user_id = token_subject(token_data)
+    return check_user(await crud_async.get_user(session=session, user_id=user_id))
+
+
+async def get_current_principal(session: AsyncSessionDep, token: TokenDep) -> Principal:
+    """
+    Authorize from the access token's claims, without loading the user. Tokens
+    are short lived, so permission changes apply within
+    ACCESS_TOKEN_EXPIRE_MINUTES.
+    """
+    token_data = decode_access_token(token)
+    user_id = token_subject(token_data)
+    if token_data.perms is None:
+        # Issued before permissions were claims
+        user = check_user(await crud_async.get_user(session=session, user_id=user_id))
+        return Principal.model_validate(user, from_attributes=True)
+    try:
+        return Principal(
+            user_id=user_id,
+            **{name: True for name in token_data.perms if name in PERMISSIONS},
+        )
+    except ValidationError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
+AsyncCurrentUser = Annotated[User, Depends(get_async_current_user)]
+CurrentPrincipal = Annotated[Principal, Depends(get_current_principal)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
-    if not current_user.is_superuser:
+async def get_current_active_superuser(principal: CurrentPrincipal) -> Principal:
+    if not principal.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
-    return current_user
+    return principal
@@ -0,0 +1,67 @@
+import hashlib
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+
+from fastapi import HTTPException, Response
+
+
+def make_etag(*parts: Any, weak: bool = True) -> str:
+    """
+    Build an ETag from values that change whenever the representation does,
+    such as ids and `updated_at` versions.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def row_etag(row_id: Any, updated_at: datetime) -> str:
+    # A row version always serializes to the same bytes, so its ETag can be
+    # strong and used with If-Match
+    return make_etag(str(row_id), updated_at.isoformat(), weak=False)
+
+
+def _opaque_tags(header: str) -> Iterable[str]:
+    for tag in header.split(","):
+        tag = tag.strip()
+        yield tag.removeprefix("W/")
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """
+    Weak comparison of `etag` against an If-None-Match header.
+    """
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in _opaque_tags(header)
+
+
+def etag_matches_strong(header: str | None, etag: str) -> bool:
+    """
+    Strong comparison of `etag` against an If-Match header, where a weak ETag
+    on either side never matches.
+    """
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    if etag.startswith("W/"):
+        return False
+    return etag in (tag.strip() for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def check_if_match(header: str | None, etag: str) -> None:
+    """
+    Reject a write made against another version than the current one.
+    """
+    if header is not None and not etag_matches_strong(header, etag):
+        raise HTTPException(
+            status_code=412,
+            detail="The resource was modified, fetch it again before updating",
+        )
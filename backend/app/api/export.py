@@ -0,0 +1,216 @@
+import csv
+import io
+import json
+import uuid
+import zlib
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any, Literal, get_args
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.core.config import settings
+from app.core.db import async_engine
+
+ExportFormat = Literal["csv", "jsonl", "parquet"]
+
+MEDIA_TYPES: dict[ExportFormat, str] = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _CsvEncoder:
+    def __init__(self, model: type[SQLModel]) -> None:
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(
+            self._buffer, fieldnames=list(model.model_fields), lineterminator="\n"
+        )
+        self._writer.writeheader()
+
+    def encode(self, rows: list[dict[str, Any]]) -> bytes:
+        self._writer.writerows(rows)
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def finish(self) -> bytes:
+        return self._buffer.getvalue().encode()
+
+
+class _JsonlEncoder:
+    def __init__(self, model: type[SQLModel]) -> None:
+        pass
+
+    def encode(self, rows: list[dict[str, Any]]) -> bytes:
+        return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands out what was written since the last `drain`,
+    while reporting the total position, which the Parquet footer relies on.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_type(annotation: Any) -> Any:
+    import pyarrow as pa  # type: ignore[import-untyped]
+
+    types = [arg for arg in get_args(annotation) if arg is not type(None)]
+    python_type = types[0] if types else annotation
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is datetime:
+        return pa.timestamp("us")
+    return pa.string()
+
+
+class _ParquetEncoder:
+    def __init__(self, model: type[SQLModel]) -> None:
+        try:
+            # Optional dependency, install the `parquet` extra
+            import pyarrow as pa
+            import pyarrow.parquet as pq  # type: ignore[import-untyped]
+        except ImportError:
+            raise HTTPException(
+                status_code=400, detail="Parquet export is not available"
+            )
+
+        self._pa = pa
+        self._schema = pa.schema(
+            [
+                (name, _arrow_type(field.annotation))
+                for name, field in model.model_fields.items()
+            ]
+        )
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema)
+
+    def encode(self, rows: list[dict[str, Any]]) -> bytes:
+        for row in rows:
+            for name, value in row.items():
+                if isinstance(value, uuid.UUID):
+                    row[name] = str(value)
+        # One row group per batch, so memory stays bounded by EXPORT_YIELD_PER
+        self._writer.write_batch(
+            self._pa.RecordBatch.from_pylist(rows, schema=self._schema)
+        )
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class _GzipEncoder:
+    def __init__(self, inner: "_Encoder") -> None:
+        self._inner = inner
+        self._compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+    def encode(self, rows: list[dict[str, Any]]) -> bytes:
+        return self._compressor.compress(self._inner.encode(rows))
+
+    def finish(self) -> bytes:
+        return (
+            self._compressor.compress(self._inner.finish()) + self._compressor.flush()
+        )
+
+
+_Encoder = _CsvEncoder | _JsonlEncoder | _ParquetEncoder | _GzipEncoder
+
+ENCODERS: dict[ExportFormat, type[_CsvEncoder | _JsonlEncoder | _ParquetEncoder]] = {
+    "csv": _CsvEncoder,
+    "jsonl": _JsonlEncoder,
+    "parquet": _ParquetEncoder,
+}
+
+
+async def _export_rows(
+    statement: SelectOfScalar[Any],
+    *,
+    model: type[SQLModel],
+    encoder: _Encoder,
+    dump_mode: str,
+) -> AsyncIterator[bytes]:
+    # The request's session is closed before the body is sent, so the stream
+    # gets its own. yield_per streams through a server-side cursor.
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream_scalars(
+            statement.execution_options(yield_per=settings.EXPORT_YIELD_PER)
+        )
+        async for partition in result.partitions():
+            rows = [
+                model.model_validate(row).model_dump(mode=dump_mode)
+                for row in partition
+            ]
+            if chunk := encoder.encode(rows):
+                yield chunk
+    if chunk := encoder.finish():
+        yield chunk
+
+
+def export_response(
+    statement: SelectOfScalar[Any],
+    *,
+    model: type[SQLModel],
+    filename: str,
+    fmt: ExportFormat,
+    compress: bool,
+) -> StreamingResponse:
+    """
+    Stream every row of `statement`, serialized through the public `model`, as
+    a CSV, JSON Lines or Parquet file download, optionally gzipped on the fly.
+    """
+    filename = f"{filename}.{fmt}"
+    media_type = MEDIA_TYPES[fmt]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    encoder: _Encoder = ENCODERS[fmt](model)
+    if compress:
+        encoder = _GzipEncoder(encoder)
+    return StreamingResponse(
+        _export_rows(
+            statement,
+            model=model,
+            encoder=encoder,
+            # pyarrow takes datetimes as objects, text formats need strings
+            dump_mode="python" if fmt == "parquet" else "json",
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
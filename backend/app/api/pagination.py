@@ -0,0 +1,111 @@
+import base64
+import json
+from collections.abc import Callable, Sequence
+from typing import Any, TypeVar, cast
+
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Mapped
+from sqlalchemy.sql.expression import ColumnElement
+from sqlmodel.sql.expression import Select, SelectOfScalar
+
+T = TypeVar("T")
+S = TypeVar("S", SelectOfScalar[Any], Select[Any])
+
+
+def order_columns(
+    *columns: Mapped[Any] | ColumnElement[Any],
+) -> tuple[ColumnElement[Any], ...]:
+    """
+    A stable sort key for `paginate` and `next_page`, from model attributes
+    like `col(Item.item_id)` or expressions.
+    """
+    return tuple(cast(ColumnElement[Any], column) for column in columns)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    Build an opaque cursor from the sort key values of the last row of a page.
+    """
+    payload = json.dumps([str(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _python_type(column: ColumnElement[Any]) -> Any:
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        # Some custom types, like SQLModel's AutoString, don't declare one
+        return str
+
+
+def decode_cursor(cursor: str, order_by: Sequence[Any]) -> list[Any]:
+    """
+    Decode a cursor back into sort key values typed like the `order_by` columns.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(raw, list) or len(raw) != len(order_by):
+            raise ValueError(cursor)
+        return [
+            TypeAdapter(_python_type(column)).validate_python(value)
+            for column, value in zip(order_by, raw, strict=True)
+        ]
+    except (ValueError, ValidationError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    statement: S,
+    *,
+    order_by: Sequence[ColumnElement[Any]],
+    skip: int,
+    limit: int,
+    cursor: str | None,
+) -> S:
+    """
+    Order `statement` by a stable sort key and page it.
+
+    With a `cursor` the page starts right after the row the cursor points to
+    using a `(key) > (cursor)` row comparison, so the database seeks straight
+    into the index instead of scanning and discarding `skip` rows. Without one,
+    the classic `skip` offset is used. One extra row is fetched so
+    `next_page` can tell whether there is a following page.
+    """
+    statement = statement.order_by(*order_by)
+    if cursor is not None:
+        values = decode_cursor(cursor, order_by)
+        statement = statement.where(tuple_(*order_by) > tuple(values))
+    else:
+        statement = statement.offset(skip)
+    return statement.limit(limit + 1)
+
+
+def next_page(
+    rows: Sequence[T],
+    *,
+    order_by: Sequence[ColumnElement[Any]],
+    limit: int,
+    sort_key: Callable[[T], Sequence[Any]] | None = None,
+) -> tuple[Sequence[T], str | None]:
+    """
+    Trim the extra row fetched by `paginate` and build the cursor for the next page.
+
+    The sort key values are read from the last row's `order_by` attributes,
+    or with `sort_key` when rows don't have them, e.g. computed expressions.
+    """
+    if len(rows) <= limit or limit <= 0:
+        # No row to point the cursor at with an empty page
+        return rows[: max(limit, 0)], None
+    rows = rows[:limit]
+    last = rows[-1]
+    if sort_key is not None:
+        return rows, encode_cursor(sort_key(last))
+    values = []
+    for column in order_by:
+        # Expressions have no attribute to read the value from
+        assert column.key is not None, "pass sort_key to page by expressions"
+        values.append(getattr(last, column.key))
+    return rows, encode_cursor(values)
@@ -1,59 +1,257 @@
 import uuid
-from typing import Any
-from datetime import datetime
+from collections.abc import Callable
+from typing import Annotated, Any
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlmodel import col, select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, ItemTake, Message
+from app import crud, crud_async
+from app.api.bulk import bulk_format, iter_records
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentPrincipal,
+    SessionDep,
+)
+from app.api.etag import (
+    check_if_match,
+    etag_matches,
+    make_etag,
+    not_modified,
+    row_etag,
+)
+from app.api.export import ExportFormat, export_response
+from app.api.pagination import next_page, order_columns, paginate
+from app.api.serialization import item_serializer
+from app.core.config import settings
+from app.core.events import (
+    broker,
+    event_stream,
+    item_event,
+    publish_item_events,
+)
+from app.models import (
+    Item,
+    ItemBatchResult,
+    ItemBulkError,
+    ItemCreate,
+    ItemFilters,
+    ItemPublic,
+    ItemsBatchResult,
+    ItemsBulkResult,
+    ItemsPublic,
+    ItemsReleaseBatch,
+    ItemsTakeBatch,
+    ItemTake,
+    ItemUpdate,
+    Message,
+)
 
 router = APIRouter(prefix="/items", tags=["items"])
 
+# Stable sort key for paging, backed by the ix_item_item_name_item_id index
+ITEMS_ORDER_BY = order_columns(col(Item.item_name), col(Item.item_id))
+
 
 @router.get("/", response_model=ItemsPublic)
-def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+async def read_items(
+    session: AsyncSessionDep,
+    principal: CurrentPrincipal,
+    filters: Annotated[ItemFilters, Depends()],
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    include_count: bool = True,
+    fields: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Retrieve items.
+
+    Pass the `next_cursor` of a previous page as `cursor` to page by keyset
+    instead of `skip`, which keeps deep pages as fast as the first one.
+    Set `include_count=false` to skip computing the total `count`.
+
+    Filter by `current_owner_id`, `current_room`, `table_name`, `system_name`
+    and `is_available`, all indexed.
+
+    Pass `fields`, e.g. `fields=item_id,item_name,is_available`, to only select
+    and return these fields of each item.
+
+    Answers 304 Not Modified, without serializing the page, when
+    `If-None-Match` has the page's current ETag.
     """
+    where = crud.item_filters(filters)
+    serializer = item_serializer.project(fields)
 
-    if current_user.is_part_of_lab:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
+    if principal.is_part_of_lab:
+        count = (
+            await crud_async.count_rows(
+                session=session,
+                model=Item,
+                strategy=settings.ITEMS_COUNT_STRATEGY,
+                filters=where,
+            )
+            if include_count
+            else None
+        )
+        # The version is only selected for the ETag
+        columns = serializer.select(Item, *ITEMS_ORDER_BY, col(Item.updated_at))
+        statement = paginate(
+            columns.where(*where),
+            order_by=ITEMS_ORDER_BY,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+        )
+        items, next_cursor = next_page(
+            (await session.exec(statement)).all(), order_by=ITEMS_ORDER_BY, limit=limit
+        )
     else:
         items = []
         count = 0
+        next_cursor = None
+
+    etag = make_etag(
+        serializer.fields,
+        count,
+        next_cursor,
+        [(str(item.item_id), item.updated_at) for item in items],
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return serializer.page_response(
+        items, count=count, next_cursor=next_cursor, headers={"ETag": etag}
+    )
+
+
+@router.get("/search", response_model=ItemsPublic)
+async def search_items(
+    session: AsyncSessionDep,
+    principal: CurrentPrincipal,
+    q: Annotated[str, Query(min_length=1, max_length=255)],
+    limit: int = 100,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Search items by name, vendor and parameters, best matches first.
 
-    return ItemsPublic(data=items, count=count)
+    Words match as prefixes and names also match with typos. Pass the
+    `next_cursor` of a previous page as `cursor` for the next page. No total
+    `count` is returned.
+    """
+    if not principal.is_part_of_lab:
+        return item_serializer.page_response([], count=0)
+
+    match, score = crud.item_search(q)
+    rank = (-score).label("rank")
+    order_by = order_columns(rank, col(Item.item_id))
+    statement = paginate(
+        select(Item, rank).where(match),
+        order_by=order_by,
+        skip=0,
+        limit=limit,
+        cursor=cursor,
+    )
+    rows, next_cursor = next_page(
+        (await session.exec(statement)).all(),
+        order_by=order_by,
+        limit=limit,
+        sort_key=lambda row: (row.rank, row.Item.item_id),
+    )
+    return item_serializer.page_response(
+        [row.Item for row in rows], next_cursor=next_cursor
+    )
+
+
+@router.get("/export")
+async def export_items(
+    principal: CurrentPrincipal,
+    format: ExportFormat = "csv",
+    gzip: bool = False,
+) -> StreamingResponse:
+    """
+    Export all items as a CSV, JSON Lines or Parquet file, optionally gzipped.
+    """
+    if not principal.is_part_of_lab:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return export_response(
+        select(Item).order_by(*ITEMS_ORDER_BY),
+        model=ItemPublic,
+        filename="items",
+        fmt=format,
+        compress=gzip,
+    )
+
+
+@router.get("/events")
+async def item_events(
+    principal: CurrentPrincipal,
+    room: str | None = None,
+    user_id: uuid.UUID | None = None,
+) -> StreamingResponse:
+    """
+    Stream item events (created, taken, released, deleted) as Server-Sent
+    Events, optionally only those of a room or of a user's takes and releases.
+    Bulk imports send one `bulk_created` event per batch and room, with the
+    `count` of items created.
+
+    Events published while the client is disconnected are not replayed, so
+    clients should refetch the items they show after reconnecting.
+    """
+    if not principal.is_part_of_lab:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    subscriber = await broker.subscribe(room=room, user_id=user_id)
+    return StreamingResponse(
+        event_stream(subscriber),
+        media_type="text/event-stream",
+        # Keep proxies from buffering or caching the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/{item_id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, item_id: uuid.UUID) -> Any:
+async def read_item(
+    session: AsyncSessionDep,
+    principal: CurrentPrincipal,
+    item_id: uuid.UUID,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Any:
     """
     Get item by ID.
+
+    Answers 304 Not Modified when `If-None-Match` has the current ETag,
+    checking only the item's version instead of loading it.
     """
-    item = session.get(Item, item_id)
+    if if_none_match is not None and principal.is_part_of_lab:
+        statement = select(Item.updated_at).where(Item.item_id == item_id)
+        updated_at = (await session.exec(statement)).first()
+        if updated_at:
+            etag = row_etag(item_id, updated_at)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+
+    item = await session.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    if not current_user.is_part_of_lab:
+    if not principal.is_part_of_lab:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    return item
+    return item_serializer.response(
+        item, headers={"ETag": row_etag(item.item_id, item.updated_at)}
+    )
 
 
 @router.post("/", response_model=ItemPublic)
 def create_item(
-    *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
+    *, session: SessionDep, principal: CurrentPrincipal, item_in: ItemCreate
 ) -> Any:
     """
     Create new item.
     """
-    if not (current_user.is_part_of_lab and current_user.can_edit_items):
+    if not (principal.is_part_of_lab and principal.can_edit_items):
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to create an item.",
@@ -61,118 +259,290 @@ def create_item(
 
     item = Item.model_validate(item_in, update={"current_owner_id": None})
     session.add(item)
+    publish_item_events(session, [item_event("created", item)])
     session.commit()
     session.refresh(item)
+    crud.invalidate_count(Item)
     return item
 
 
+@router.post("/bulk", response_model=ItemsBulkResult)
+async def create_items_bulk(
+    request: Request, session: AsyncSessionDep, principal: CurrentPrincipal
+) -> Any:
+    """
+    Create items from a CSV (with a header row) or JSON Lines body.
+
+    The body is streamed and inserted in batches inside one transaction, so
+    any file size uses the same memory. Rows that don't validate are skipped
+    and reported by line number, the other rows are created.
+    """
+    if not (principal.is_part_of_lab and principal.can_edit_items):
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have sufficient permissions to create an item.",
+        )
+    fmt = bulk_format(request.headers.get("content-type"))
+
+    created = 0
+    failed = 0
+    errors: list[ItemBulkError] = []
+    batch: list[ItemCreate] = []
+
+    def reject(line: int, detail: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < settings.ITEMS_BULK_MAX_ERRORS:
+            errors.append(ItemBulkError(line=line, detail=detail))
+
+    records = iter_records(
+        request.stream(),
+        fmt,
+        max_line_bytes=settings.ITEMS_BULK_MAX_LINE_BYTES,
+        max_record_lines=settings.ITEMS_BULK_MAX_RECORD_LINES,
+    )
+    async for line, record in records:
+        if record is None:
+            reject(line, "Malformed row")
+            continue
+        try:
+            batch.append(ItemCreate.model_validate(record))
+        except ValidationError as e:
+            reject(
+                line,
+                "; ".join(
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                    for error in e.errors()
+                ),
+            )
+            continue
+        if len(batch) >= settings.ITEMS_BULK_BATCH_SIZE:
+            await crud_async.insert_items(session=session, items_in=batch)
+            created += len(batch)
+            batch.clear()
+    if batch:
+        await crud_async.insert_items(session=session, items_in=batch)
+        created += len(batch)
+    if created:
+        await session.commit()
+        await crud_async.invalidate_count(Item)
+
+    return ItemsBulkResult(created=created, failed=failed, errors=errors)
+
+
 @router.put("/{item_id}", response_model=ItemPublic)
 def update_item(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    principal: CurrentPrincipal,
     item_id: uuid.UUID,
     item_in: ItemUpdate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Update an item.
+
+    With `If-Match`, the update only succeeds if the item still has that ETag.
     """
-    item = session.get(Item, item_id)
+    # Lock the row so nobody updates it between the version check and ours
+    item = session.get(Item, item_id, with_for_update=if_match is not None)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    if not (current_user.is_part_of_lab and current_user.can_edit_items):
+    if not (principal.is_part_of_lab and principal.can_edit_items):
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to create an item.",
         )
+    check_if_match(if_match, row_etag(item.item_id, item.updated_at))
     update_dict = item_in.model_dump(exclude_unset=True)
     item.sqlmodel_update(update_dict)
     session.add(item)
     session.commit()
     session.refresh(item)
+    response.headers["ETag"] = row_etag(item.item_id, item.updated_at)
     return item
 
+
 @router.put("/{item_id}/take", response_model=ItemPublic)
-def take_item(
+async def take_item(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    principal: CurrentPrincipal,
     item_id: uuid.UUID,
     item_take: ItemTake,
 ) -> Any:
     """
     Take an item. Only users who are part of the lab can take an item.
     """
-    item = session.get(Item, item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-
     # Check if the user is part of the lab
-    if not current_user.is_part_of_lab:
+    if not principal.is_part_of_lab:
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to take this item.",
         )
 
-    update_dict = item_take.model_dump(exclude_unset=True)
-    for field, value in update_dict.items():
-        setattr(item, field, value)
-
-    if item_take.current_owner_id is None:
-        item.current_owner_id = current_user.id
-
-    if item_take.taken_at is None:
-        item.taken_at = datetime.utcnow()
-
-    if item_take.is_available is None:
-        item.is_available = False
-
-    session.add(item)
-    session.commit()
-    session.refresh(item)
+    item = await crud_async.take_item(
+        session=session,
+        item_id=item_id,
+        user_id=principal.user_id,
+        item_take=item_take,
+    )
+    if not item:
+        if not await session.get(Item, item_id):
+            raise HTTPException(status_code=404, detail="Item not found")
+        raise HTTPException(status_code=409, detail="Item is already taken")
     return item
 
+
 @router.put("/{item_id}/release", response_model=ItemPublic)
-def release_item(
+async def release_item(
     *,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    principal: CurrentPrincipal,
     item_id: uuid.UUID,
 ) -> Any:
     """
     Release an item. Only users who are part of the lab and are the current owner can release an item.
     """
-    item = session.get(Item, item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-
     # Check if the user is part of the lab
-    if not current_user.is_part_of_lab:
+    if not principal.is_part_of_lab:
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to release this item.",
         )
 
-    # Check if the current user is the owner of the item
-    if item.current_owner_id != current_user.user_id:
+    item = await crud_async.release_item(
+        session=session, item_id=item_id, user_id=principal.user_id
+    )
+    if not item:
+        item = await session.get(Item, item_id)
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
+        if item.is_available:
+            raise HTTPException(status_code=409, detail="Item is not taken")
         raise HTTPException(
             status_code=403,
             detail="You are not the current owner of this item.",
         )
+    return item
 
-    # Update the item's fields to release it
-    item.current_owner_id = None
-    item.is_available = True
-    item.taken_at = None
 
-    session.add(item)
-    session.commit()
-    session.refresh(item)
-    return item
+async def _batch_result(
+    *,
+    session: AsyncSessionDep,
+    item_ids: list[uuid.UUID],
+    done: list[Item],
+    failure_detail: Callable[[Item], str],
+) -> ItemsBatchResult:
+    done_by_id = {item.item_id: item for item in done}
+    failed_ids = [item_id for item_id in item_ids if item_id not in done_by_id]
+    failed_by_id = {}
+    if failed_ids:
+        # Only look items up to explain failures, success costs one statement
+        statement = select(Item).where(col(Item.item_id).in_(failed_ids))
+        failed_by_id = {item.item_id: item for item in await session.exec(statement)}
+
+    data = []
+    for item_id in item_ids:
+        if item_id in done_by_id:
+            result = ItemBatchResult(
+                item_id=item_id, success=True, item=done_by_id[item_id]
+            )
+        elif item_id in failed_by_id:
+            result = ItemBatchResult(
+                item_id=item_id,
+                success=False,
+                detail=failure_detail(failed_by_id[item_id]),
+            )
+        else:
+            result = ItemBatchResult(
+                item_id=item_id, success=False, detail="Item not found"
+            )
+        data.append(result)
+    return ItemsBatchResult(
+        data=data, succeeded=len(done_by_id), failed=len(item_ids) - len(done_by_id)
+    )
+
+
+@router.post("/take-batch", response_model=ItemsBatchResult)
+async def take_items(
+    session: AsyncSessionDep, principal: CurrentPrincipal, batch_in: ItemsTakeBatch
+) -> Any:
+    """
+    Take several items in one transaction.
+
+    With `atomic` (the default) either every item is taken or none is, otherwise
+    every available item is taken. The result of each item is returned.
+    """
+    if not principal.is_part_of_lab:
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have sufficient permissions to take this item.",
+        )
+
+    item_ids = list(dict.fromkeys(batch_in.item_ids))
+    items = await crud_async.take_items(
+        session=session,
+        item_ids=item_ids,
+        user_id=principal.user_id,
+        item_take=ItemTake.model_validate(
+            batch_in.model_dump(exclude_unset=True, exclude={"item_ids", "atomic"})
+        ),
+        atomic=batch_in.atomic,
+    )
+
+    def failure_detail(item: Item) -> str:
+        if not item.is_available:
+            return "Item is already taken"
+        return "Not taken, another item of the batch can't be taken"
+
+    return await _batch_result(
+        session=session, item_ids=item_ids, done=items, failure_detail=failure_detail
+    )
+
+
+@router.post("/release-batch", response_model=ItemsBatchResult)
+async def release_items(
+    session: AsyncSessionDep,
+    principal: CurrentPrincipal,
+    batch_in: ItemsReleaseBatch,
+) -> Any:
+    """
+    Release several items held by the current user in one transaction.
+
+    With `atomic` (the default) either every item is released or none is,
+    otherwise every item held by the user is released.
+    """
+    if not principal.is_part_of_lab:
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have sufficient permissions to release this item.",
+        )
+
+    item_ids = list(dict.fromkeys(batch_in.item_ids))
+    items = await crud_async.release_items(
+        session=session,
+        item_ids=item_ids,
+        user_id=principal.user_id,
+        atomic=batch_in.atomic,
+    )
+
+    def failure_detail(item: Item) -> str:
+        if item.is_available:
+            return "Item is not taken"
+        if item.current_owner_id != principal.user_id:
+            return "You are not the current owner of this item."
+        return "Not released, another item of the batch can't be released"
+
+    return await _batch_result(
+        session=session, item_ids=item_ids, done=items, failure_detail=failure_detail
+    )
+
 
 @router.delete("/{item_id}")
 def delete_item(
-    session: SessionDep, current_user: CurrentUser, item_id: uuid.UUID
+    session: SessionDep, principal: CurrentPrincipal, item_id: uuid.UUID
 ) -> Message:
     """
     Delete an item.
@@ -180,11 +550,13 @@ def delete_item(
     item = session.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    if not (current_user.is_part_of_lab and current_user.can_edit_items):
+    if not (principal.is_part_of_lab and principal.can_edit_items):
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to create an item.",
         )
     session.delete(item)
+    publish_item_events(session, [item_event("deleted", item)])
     session.commit()
+    crud.invalidate_count(Item)
     return Message(message="Item deleted successfully")
@@ -1,20 +1,24 @@
-from datetime import timedelta
 from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
-from app.core import security
-from app.core.config import settings
-from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app import crud, crud_async
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentUser,
+    SessionDep,
+    TokenDep,
+    decode_access_token,
+    get_current_active_superuser,
+)
+from app.core import outbox
+from app.core.security import get_password_hash_async
+from app.models import Message, NewPassword, Token, TokenRefresh, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
-    send_email,
     verify_password_reset_token,
 )
 
@@ -22,25 +26,51 @@ router = APIRouter(tags=["login"])
 
 
 @router.post("/login/access-token")
-def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+async def login_access_token(
+    session: AsyncSessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
+    user = await crud_async.authenticate(
         session=session, email=form_data.username, password=form_data.password
     )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    return Token(
-        access_token=security.create_access_token(
-            user.user_id, expires_delta=access_token_expires
-        )
+    return await crud_async.issue_tokens(session=session, user=user)
+
+
+@router.post("/login/refresh-token")
+async def refresh_access_token(session: AsyncSessionDep, body: TokenRefresh) -> Token:
+    """
+    Get a new access token, and the refresh token to use next time
+    """
+    token = await crud_async.rotate_refresh_token(
+        session=session, refresh_token=body.refresh_token
     )
+    if token is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token
+
+
+@router.post("/logout")
+async def logout(session: AsyncSessionDep, token: TokenDep) -> Message:
+    """
+    Revoke the access token used for this request and end its login session
+    """
+    token_data = decode_access_token(token)
+    if token_data.jti is None or token_data.exp is None:
+        # Issued before tokens had an id, it will just expire
+        raise HTTPException(status_code=400, detail="This token can't be revoked")
+    await crud_async.revoke_token(session=session, token_data=token_data)
+    return Message(message="Logged out")
 
 
 @router.post("/login/test-token", response_model=UserPublic)
@@ -67,23 +97,26 @@ def recover_password(email: str, session: SessionDep) -> Message:
     email_data = generate_reset_password_email(
         email_to=user.email, email=email, token=password_reset_token
     )
-    send_email(
+    outbox.queue_email(
+        session,
         email_to=user.email,
         subject=email_data.subject,
         html_content=email_data.html_content,
     )
+    session.commit()
+    outbox.dispatcher.wake()
     return Message(message="Password recovery email sent")
 
 
 @router.post("/reset-password/")
-def reset_password(session: SessionDep, body: NewPassword) -> Message:
+async def reset_password(session: AsyncSessionDep, body: NewPassword) -> Message:
     """
     Reset password
     """
     email = verify_password_reset_token(token=body.token)
     if not email:
         raise HTTPException(status_code=400, detail="Invalid token")
-    user = crud.get_user_by_email(session=session, email=email)
+    user = await crud_async.get_user_by_email(session=session, email=email)
     if not user:
         raise HTTPException(
             status_code=404,
@@ -91,10 +124,12 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
         )
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    hashed_password = get_password_hash(password=body.new_password)
+    hashed_password = await get_password_hash_async(body.new_password)
     user.hashed_password = hashed_password
     session.add(user)
-    session.commit()
+    await crud_async.end_user_sessions(session=session, user_id=user.user_id)
+    await session.commit()
+    await crud_async.invalidate_user(user.user_id)
     return Message(message="Password updated successfully")
 
 
@@ -1,24 +1,38 @@
 import uuid
-from typing import Any
-
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import func, select
-
-from app.api.deps import CurrentUser, SessionDep
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import col, select
+
+from app import crud, crud_async
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentPrincipal,
+    SessionDep,
+)
+from app.api.etag import check_if_match, etag_matches, not_modified, row_etag
+from app.api.export import ExportFormat, export_response
+from app.api.pagination import next_page, order_columns, paginate
+from app.api.serialization import room_serializer
+from app.core.config import settings
 from app.models import Room, RoomCreate, RoomPublic, RoomsPublic, RoomUpdate, Message
 
 router = APIRouter(prefix="/rooms", tags=["rooms"])
 
+# Stable sort key for paging, backed by the ix_room_room_number_room_id index
+ROOMS_ORDER_BY = order_columns(col(Room.room_number), col(Room.room_id))
+
 
 @router.post("/", response_model=RoomPublic)
 def create_room(
-    *, session: SessionDep, current_user: CurrentUser, room_in: RoomCreate
+    *, session: SessionDep, principal: CurrentPrincipal, room_in: RoomCreate
 ) -> Any:
     """
     Create a new room.
     """
     # Check if the user is part of the lab and has the `can_edit_labs` permission
-    if not (current_user.is_part_of_lab and current_user.can_edit_labs):
+    if not (principal.is_part_of_lab and principal.can_edit_labs):
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to create a room.",
@@ -27,80 +41,142 @@ def create_room(
     # Create the room and set the room_owner_id to the current user's ID if not provided
     room_data = room_in.model_dump()
     if room_data.get("room_owner_id") is None:
-        room_data["room_owner_id"] = current_user.id
+        room_data["room_owner_id"] = principal.user_id
 
     room = Room(**room_data)
     session.add(room)
     session.commit()
     session.refresh(room)
+    crud.invalidate_count(Room)
     return room
 
 
 @router.get("/", response_model=RoomsPublic)
-def read_rooms(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+async def read_rooms(
+    session: AsyncSessionDep,
+    principal: CurrentPrincipal,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    include_count: bool = True,
 ) -> Any:
     """
     Retrieve all rooms.
+
+    Pass the `next_cursor` of a previous page as `cursor` to page by keyset
+    instead of `skip`. Set `include_count=false` to skip computing the total `count`.
     """
     # Check if the user is part of the lab
-    if not current_user.is_part_of_lab:
+    if not principal.is_part_of_lab:
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to view rooms.",
         )
 
-    count_statement = select(func.count()).select_from(Room)
-    count = session.exec(count_statement).one()
-
-    statement = select(Room).offset(skip).limit(limit)
-    rooms = session.exec(statement).all()
-
-    return RoomsPublic(data=rooms, count=count)
+    count = (
+        await crud_async.count_rows(
+            session=session, model=Room, strategy=settings.ROOMS_COUNT_STRATEGY
+        )
+        if include_count
+        else None
+    )
+
+    statement = paginate(
+        select(Room), order_by=ROOMS_ORDER_BY, skip=skip, limit=limit, cursor=cursor
+    )
+    rooms, next_cursor = next_page(
+        (await session.exec(statement)).all(), order_by=ROOMS_ORDER_BY, limit=limit
+    )
+
+    return room_serializer.page_response(rooms, count=count, next_cursor=next_cursor)
+
+
+@router.get("/export")
+async def export_rooms(
+    principal: CurrentPrincipal,
+    format: ExportFormat = "csv",
+    gzip: bool = False,
+) -> StreamingResponse:
+    """
+    Export all rooms as a CSV, JSON Lines or Parquet file, optionally gzipped.
+    """
+    if not principal.is_part_of_lab:
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have sufficient permissions to view rooms.",
+        )
+    return export_response(
+        select(Room).order_by(*ROOMS_ORDER_BY),
+        model=RoomPublic,
+        filename="rooms",
+        fmt=format,
+        compress=gzip,
+    )
 
 
 @router.get("/{room_id}", response_model=RoomPublic)
 def read_room(
-    session: SessionDep, current_user: CurrentUser, room_id: uuid.UUID
+    session: SessionDep,
+    principal: CurrentPrincipal,
+    room_id: uuid.UUID,
+    if_none_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Get a room by ID.
+
+    Answers 304 Not Modified when `If-None-Match` has the current ETag,
+    checking only the room's version instead of loading it.
     """
     # Check if the user is part of the lab
-    if not current_user.is_part_of_lab:
+    if not principal.is_part_of_lab:
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to view this room.",
         )
 
+    if if_none_match is not None:
+        statement = select(Room.updated_at).where(Room.room_id == room_id)
+        updated_at = session.exec(statement).first()
+        if updated_at:
+            etag = row_etag(room_id, updated_at)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+
     room = session.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    return room
+    return room_serializer.response(
+        room, headers={"ETag": row_etag(room.room_id, room.updated_at)}
+    )
 
 
 @router.put("/{room_id}", response_model=RoomPublic)
 def update_room(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    principal: CurrentPrincipal,
     room_id: uuid.UUID,
     room_in: RoomUpdate,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Update a room.
+
+    With `If-Match`, the update only succeeds if the room still has that ETag.
     """
     # Check if the user is part of the lab and has the `can_edit_labs` permission
-    if not (current_user.is_part_of_lab and current_user.can_edit_labs):
+    if not (principal.is_part_of_lab and principal.can_edit_labs):
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to update a room.",
         )
 
-    room = session.get(Room, room_id)
+    room = session.get(Room, room_id, with_for_update=if_match is not None)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
+    check_if_match(if_match, row_etag(room.room_id, room.updated_at))
 
     update_dict = room_in.model_dump(exclude_unset=True)
     for field, value in update_dict.items():
@@ -109,18 +185,19 @@ def update_room(
     session.add(room)
     session.commit()
     session.refresh(room)
+    response.headers["ETag"] = row_etag(room.room_id, room.updated_at)
     return room
 
 
 @router.delete("/{room_id}", response_model=Message)
 def delete_room(
-    session: SessionDep, current_user: CurrentUser, room_id: uuid.UUID
+    session: SessionDep, principal: CurrentPrincipal, room_id: uuid.UUID
 ) -> Any:
     """
     Delete a room.
     """
     # Check if the user is part of the lab and has the `can_edit_labs` permission
-    if not (current_user.is_part_of_lab and current_user.can_edit_labs):
+    if not (principal.is_part_of_lab and principal.can_edit_labs):
         raise HTTPException(
             status_code=403,
             detail="You do not have sufficient permissions to delete a room.",
@@ -132,4 +209,5 @@ def delete_room(
 
     session.delete(room)
     session.commit()
+    crud.invalidate_count(Room)
     return Message(message="Room deleted successfully")
\ No newline at end of file
@@ -1,17 +1,24 @@
 import uuid
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import col, delete, select
 
-from app import crud
+from app import crud, crud_async
 from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
     CurrentUser,
     SessionDep,
     get_current_active_superuser,
 )
+from app.api.etag import check_if_match, etag_matches, not_modified, row_etag
+from app.api.export import ExportFormat, export_response
+from app.api.pagination import next_page, order_columns, paginate
+from app.api.serialization import user_serializer
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash_async, verify_password_async
 from app.models import (
     Item,
     Message,
@@ -25,10 +32,13 @@ from app.models import (
     UserUpdateMe,
     UserPermissionsUpdate,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import generate_new_account_email
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Stable sort key for paging, backed by the unique ix_user_email index
+USERS_ORDER_BY = order_columns(col(User.email), col(User.user_id))
+
 
 @router.get(
     "/",
@@ -39,26 +49,61 @@ def read_users(
     current_user: CurrentUser,
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
+    include_count: bool = True,
+    fields: str | None = None,
 ) -> Any:
     """
     Retrieve users.
+
+    Pass the `next_cursor` of a previous page as `cursor` to page by keyset
+    instead of `skip`. Set `include_count=false` to skip computing the total `count`.
+
+    Pass `fields`, e.g. `fields=user_id,email`, to only select and return these
+    fields of each user.
     """
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    serializer = user_serializer.project(fields)
+    count = (
+        crud.count_rows(
+            session=session, model=User, strategy=settings.USERS_COUNT_STRATEGY
+        )
+        if include_count
+        else None
+    )
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    statement = paginate(
+        serializer.select(User, *USERS_ORDER_BY),
+        order_by=USERS_ORDER_BY,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+    )
+    users, next_cursor = next_page(
+        session.exec(statement).all(), order_by=USERS_ORDER_BY, limit=limit
+    )
 
-    return UsersPublic(data=users, count=count)
+    return serializer.page_response(users, count=count, next_cursor=next_cursor)
 
 
 @router.patch("/me", response_model=UserPublic)
 def update_user_me(
-    *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
+    *,
+    session: SessionDep,
+    user_in: UserUpdateMe,
+    current_user: CurrentUser,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Update own user.
+
+    With `If-Match`, the update only succeeds if the user still has that ETag.
     """
+    if if_match is not None:
+        # The user may come from the cache, check the locked row's version
+        session.refresh(current_user, with_for_update=True)
+        etag = row_etag(current_user.user_id, current_user.updated_at)
+        check_if_match(if_match, etag)
 
     if user_in.email:
         existing_user = crud.get_user_by_email(session=session, email=user_in.email)
@@ -70,36 +115,51 @@ def update_user_me(
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
+    crud.invalidate_user(current_user.user_id)
     session.refresh(current_user)
+    etag = row_etag(current_user.user_id, current_user.updated_at)
+    response.headers["ETag"] = etag
     return current_user
 
 
 @router.patch("/me/password", response_model=Message)
-def update_password_me(
-    *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
+async def update_password_me(
+    *, session: AsyncSessionDep, body: UpdatePassword, current_user: AsyncCurrentUser
 ) -> Any:
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
+    # Left out of the cached user
+    await session.refresh(current_user, ["hashed_password"])
+    if not await verify_password_async(
+        body.current_password, current_user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(
             status_code=400, detail="New password cannot be the same as the current one"
         )
-    hashed_password = get_password_hash(body.new_password)
+    hashed_password = await get_password_hash_async(body.new_password)
     current_user.hashed_password = hashed_password
     session.add(current_user)
-    session.commit()
+    await crud_async.end_user_sessions(session=session, user_id=current_user.user_id)
+    await session.commit()
+    await crud_async.invalidate_user(current_user.user_id)
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+async def read_user_me(
+    current_user: AsyncCurrentUser,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Any:
     """
     Get current user.
     """
-    return current_user
+    etag = row_etag(current_user.user_id, current_user.updated_at)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return user_serializer.response(current_user, headers={"ETag": etag})
 
 
 @router.delete("/me", response_model=Message)
@@ -111,25 +171,42 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
+    crud.invalidate_user(current_user.user_id)
     return Message(message="User deleted successfully")
 
 
 @router.post("/signup", response_model=UserPublic)
-def register_user(session: SessionDep, user_in: UserRegister) -> Any:
+async def register_user(session: AsyncSessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    user = await crud_async.get_user_by_email(session=session, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
     user_create = UserCreate.model_validate(user_in)
-    user = crud.create_user(session=session, user_create=user_create)
+    user = await crud_async.create_user(session=session, user_create=user_create)
     return user
 
 
+@router.get("/export", dependencies=[Depends(get_current_active_superuser)])
+async def export_users(
+    format: ExportFormat = "csv", gzip: bool = False
+) -> StreamingResponse:
+    """
+    Export all users as a CSV, JSON Lines or Parquet file, optionally gzipped.
+    """
+    return export_response(
+        select(User).order_by(*USERS_ORDER_BY),
+        model=UserPublic,
+        filename="users",
+        fmt=format,
+        compress=gzip,
+    )
+
+
 @router.get("/{user_id}", response_model=UserPublic)
 def read_user_by_id(
     user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
@@ -153,10 +230,14 @@ def update_user_permissions(
     session: SessionDep,
     user_id: uuid.UUID,
     permissions_in: UserPermissionsUpdate,
-    current_user: CurrentUser
+    current_user: CurrentUser,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
 ) -> Any:
     """
     Update user permissions. Only superusers or users with `can_edit_users` permission can perform this action.
+
+    With `If-Match`, the update only succeeds if the user still has that ETag.
     """
     if not (current_user.is_superuser or current_user.can_edit_users):
         raise HTTPException(
@@ -165,9 +246,10 @@ def update_user_permissions(
         )
 
     # Retrieve the user to update
-    user = session.get(User, user_id)
+    user = session.get(User, user_id, with_for_update=if_match is not None)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    check_if_match(if_match, row_etag(user.user_id, user.updated_at))
 
     # Update the user's permissions
     for field, value in permissions_in.model_dump(exclude_unset=True).items():
@@ -175,8 +257,10 @@ def update_user_permissions(
 
     session.add(user)
     session.commit()
+    crud.invalidate_user(user.user_id)
     session.refresh(user)
 
+    response.headers["ETag"] = row_etag(user.user_id, user.updated_at)
     return user
 
 
@@ -194,4 +278,5 @@ def delete_user(
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
+    crud.invalidate_user(user.user_id)
     return Message(message="User deleted successfully")
@@ -1,9 +1,13 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
-from app.models import Message
-from app.utils import generate_test_email, send_email
+from app.api.deps import SessionDep, get_current_active_superuser
+from app.core import outbox
+from app.core.db import get_pool_stats
+from app.models import DatabasePoolStats, Message
+from app.utils import generate_test_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
 
@@ -13,19 +17,34 @@ router = APIRouter(prefix="/utils", tags=["utils"])
     dependencies=[Depends(get_current_active_superuser)],
     status_code=201,
 )
-def test_email(email_to: EmailStr) -> Message:
+def test_email(session: SessionDep, email_to: EmailStr) -> Message:
     """
     Test emails.
     """
     email_data = generate_test_email(email_to=email_to)
-    send_email(
+    outbox.queue_email(
+        session,
         email_to=email_to,
         subject=email_data.subject,
         html_content=email_data.html_content,
     )
+    session.commit()
+    outbox.dispatcher.wake()
     return Message(message="Test email sent")
 
 
+@router.get(
+    "/db-pool/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[DatabasePoolStats],
+)
+def read_db_pool_stats() -> Any:
+    """
+    Connection pool usage of the worker process serving this request.
+    """
+    return get_pool_stats()
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
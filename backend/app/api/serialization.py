@@ -0,0 +1,126 @@
+"""
+Fast path for responses built from ORM rows.
+
+Rows loaded from the database were validated when they were written, so list
+and detail routes don't validate them into the `...Public` model and then
+again against the route's `response_model`: they copy the public fields off
+the rows and encode them with orjson. `response_model` still documents the
+response in OpenAPI.
+"""
+
+from collections.abc import Callable, Iterable, Sequence
+from operator import attrgetter, itemgetter
+from typing import Any
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import ColumnElement, Row
+from sqlalchemy.orm import Mapped
+from sqlmodel import SQLModel, select
+from sqlmodel.sql.expression import Select
+
+from app.api.pagination import order_columns
+from app.models import ItemPublic, RoomPublic, UserPublic
+
+
+def _tuple_getter(
+    getter: Callable[..., Callable[[Any], Any]], names: tuple[str, ...]
+) -> Callable[[Any], tuple[Any, ...]]:
+    # attrgetter and itemgetter only return tuples for two names or more
+    if len(names) == 1:
+        get_one = getter(names[0])
+        return lambda obj: (get_one(obj),)
+    return getter(*names)
+
+
+class RowSerializer:
+    """
+    Builds the JSON of a public model, or of some of its `fields`, from rows
+    having these fields as attributes, without validating them. Rows are
+    table model instances or plain rows from `select`.
+    """
+
+    def __init__(
+        self, model: type[SQLModel], fields: Sequence[str] | None = None
+    ) -> None:
+        self.model = model
+        self.fields = tuple(model.model_fields if fields is None else fields)
+        self._loaded_values = _tuple_getter(itemgetter, self.fields)
+        self._values = _tuple_getter(attrgetter, self.fields)
+        self._projections: dict[tuple[str, ...], RowSerializer] = {}
+
+    def project(self, fields: str | None) -> "RowSerializer":
+        """
+        Serializer of the comma separated `fields` only, for a `fields` query
+        parameter, or of every field when `fields` is None.
+        """
+        if fields is None:
+            return self
+        requested = {name.strip() for name in fields.split(",")} - {""}
+        unknown = requested - set(self.fields)
+        if unknown or not requested:
+            raise HTTPException(
+                status_code=422,
+                detail=f"fields must be a comma separated list of: "
+                f"{', '.join(self.fields)}",
+            )
+        # In the model's order, so equivalent requests share a serializer
+        names = tuple(name for name in self.fields if name in requested)
+        if names not in self._projections:
+            self._projections[names] = RowSerializer(self.model, names)
+        return self._projections[names]
+
+    def select(
+        self, table: type[SQLModel], *extra: Mapped[Any] | ColumnElement[Any]
+    ) -> Select[Any]:
+        """
+        SELECT of `table`'s columns for the serialized fields and the `extra`
+        columns (e.g. the sort key), as plain rows that skip ORM hydration.
+        """
+        names = dict.fromkeys(self.fields)
+        for column in order_columns(*extra):
+            assert column.key is not None, "extra columns must be table columns"
+            names[column.key] = None
+        statement: Select[Any] = select(*(getattr(table, name) for name in names))
+        return statement
+
+    def dump(self, row: Any) -> dict[str, Any]:
+        if isinstance(row, Row):
+            values = self._loaded_values(row._mapping)
+        else:
+            try:
+                # Loaded column values are in the instance dict, reading them
+                # there skips the ORM's attribute instrumentation
+                values = self._loaded_values(row.__dict__)
+            except KeyError:
+                # Expired or deferred attributes, let the ORM load them
+                values = self._values(row)
+        return dict(zip(self.fields, values, strict=True))
+
+    def response(
+        self, row: Any, *, headers: dict[str, str] | None = None
+    ) -> ORJSONResponse:
+        return ORJSONResponse(self.dump(row), headers=headers)
+
+    def page_response(
+        self,
+        rows: Iterable[Any],
+        *,
+        count: int | None = None,
+        next_cursor: str | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> ORJSONResponse:
+        """
+        Response of an `...sPublic` page: `data`, `count` and `next_cursor`.
+        """
+        content = {
+            "data": [self.dump(row) for row in rows],
+            "count": count,
+            "next_cursor": next_cursor,
+        }
+        return ORJSONResponse(content, headers=headers)
+
+
+item_serializer = RowSerializer(ItemPublic)
+room_serializer = RowSerializer(RoomPublic)
+user_serializer = RowSerializer(UserPublic)
@@ -0,0 +1,99 @@
+"""
+Find password hashing costs that make one verify take about `--target-ms` on
+this machine, and print the settings to put in the environment.
+
+    python -m app.calibrate_password_hashing --target-ms 250
+"""
+
+import argparse
+import logging
+import time
+
+from app.core.config import settings
+from app.core.security import make_pwd_context
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PASSWORD = "calibration-password"
+
+
+def time_verify(**policy: int | str) -> float:
+    context = make_pwd_context(
+        **{
+            "scheme": settings.PASSWORD_HASH_SCHEME,
+            "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+            "argon2_time_cost": settings.ARGON2_TIME_COST,
+            "argon2_memory_cost": settings.ARGON2_MEMORY_COST,
+            "argon2_parallelism": settings.ARGON2_PARALLELISM,
+            **policy,
+        }  # type: ignore[arg-type]
+    )
+    hashed = context.hash(PASSWORD)
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        context.verify(PASSWORD, hashed)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def calibrate_bcrypt(target_ms: float) -> dict[str, int]:
+    # Each extra round doubles the work
+    rounds = 10
+    while (
+        rounds < 16
+        and time_verify(scheme="bcrypt", bcrypt_rounds=rounds + 1) <= target_ms
+    ):
+        rounds += 1
+    logger.info(
+        f"bcrypt rounds={rounds}: "
+        f"{time_verify(scheme='bcrypt', bcrypt_rounds=rounds):.0f}ms"
+    )
+    return {"BCRYPT_ROUNDS": rounds}
+
+
+def calibrate_argon2(target_ms: float) -> dict[str, int]:
+    # Keep the memory cost, it is what makes argon2 expensive on GPUs, and
+    # spend the remaining budget on passes
+    memory_cost = settings.ARGON2_MEMORY_COST
+    time_cost = 1
+    while (
+        time_cost < 20
+        and time_verify(
+            scheme="argon2",
+            argon2_time_cost=time_cost + 1,
+            argon2_memory_cost=memory_cost,
+        )
+        <= target_ms
+    ):
+        time_cost += 1
+    elapsed = time_verify(
+        scheme="argon2", argon2_time_cost=time_cost, argon2_memory_cost=memory_cost
+    )
+    logger.info(
+        f"argon2 time_cost={time_cost} memory_cost={memory_cost}: {elapsed:.0f}ms"
+    )
+    return {"ARGON2_TIME_COST": time_cost, "ARGON2_MEMORY_COST": memory_cost}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument(
+        "--scheme", choices=["argon2", "bcrypt"], default=settings.PASSWORD_HASH_SCHEME
+    )
+    args = parser.parse_args()
+
+    logger.info(f"Calibrating {args.scheme} for {args.target_ms:.0f}ms per verify")
+    if args.scheme == "bcrypt":
+        values = calibrate_bcrypt(args.target_ms)
+    else:
+        values = calibrate_argon2(args.target_ms)
+    print(f"PASSWORD_HASH_SCHEME={args.scheme}")
+    for key, value in values.items():
+        print(f"{key}={value}")
+
+
+if __name__ == "__main__":
+    main()
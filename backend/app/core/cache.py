@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any, Generic, TypeVar
+
+from app.core.config import settings
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Bounded, thread-safe LRU cache whose entries expire `ttl` seconds after being set.
+
+    Sync routes run in the threadpool, so every access takes a lock.
+    """
+
+    def __init__(self, *, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    # Async versions, for the interface shared with RedisCache
+
+    async def aget(self, key: K) -> V | None:
+        return self.get(key)
+
+    async def aset(self, key: K, value: V, ttl: float | None = None) -> None:
+        self.set(key, value, ttl)
+
+    async def adelete(self, key: K) -> None:
+        self.delete(key)
+
+
+class RedisCache:
+    """
+    Cache shared by every worker through Redis, with the same interface as
+    `TTLCache`. Values must be JSON serializable. Async code must use the `a`
+    methods, so round trips to Redis don't block the event loop.
+    """
+
+    def __init__(self, url: str, *, namespace: str, ttl: float) -> None:
+        # Optional dependency, only needed when CACHE_REDIS_URL is set
+        import redis  # type: ignore[import-untyped]
+        import redis.asyncio  # type: ignore[import-untyped]
+
+        self.client = redis.Redis.from_url(url)
+        self.async_client = redis.asyncio.Redis.from_url(url)
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _ttl_ms(self, ttl: float | None) -> int:
+        return max(int((self.ttl if ttl is None else ttl) * 1000), 1)
+
+    def get(self, key: Hashable) -> Any | None:
+        raw = self.client.get(self._key(key))
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        self.client.set(self._key(key), json.dumps(value), px=self._ttl_ms(ttl))
+
+    def delete(self, key: Hashable) -> None:
+        self.client.delete(self._key(key))
+
+    async def aget(self, key: Hashable) -> Any | None:
+        raw = await self.async_client.get(self._key(key))
+        return None if raw is None else json.loads(raw)
+
+    async def aset(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        await self.async_client.set(
+            self._key(key), json.dumps(value), px=self._ttl_ms(ttl)
+        )
+
+    async def adelete(self, key: Hashable) -> None:
+        await self.async_client.delete(self._key(key))
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(f"{self.namespace}:*"):
+            self.client.delete(key)
+
+
+Cache = TTLCache[Any, Any] | RedisCache
+
+
+def make_cache(*, namespace: str, maxsize: int, ttl: float) -> Cache:
+    """
+    Build a cache in Redis when CACHE_REDIS_URL is set, so all workers agree on
+    entries and invalidations, or in this process otherwise.
+    """
+    if settings.CACHE_REDIS_URL:
+        return RedisCache(settings.CACHE_REDIS_URL, namespace=namespace, ttl=ttl)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
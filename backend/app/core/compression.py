@@ -0,0 +1,224 @@
+"""
+Response compression negotiated from the request's Accept-Encoding.
+
+Unlike Starlette's GZipMiddleware, this also offers Brotli and Zstandard,
+flushes every chunk of a streaming response as soon as it's compressed so
+exports keep streaming, and passes through responses that already have a
+Content-Encoding or an already compressed media type.
+"""
+
+import importlib.util
+import zlib
+from collections.abc import Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import CompressionEncoding, settings
+
+# Optional dependency providing each encoding, install the `compression` extra
+OPTIONAL_MODULES = {"br": "brotli", "zstd": "zstandard"}
+
+# Already compressed, or event streams whose small frames must go out at once
+UNCOMPRESSED_MEDIA_TYPES = (
+    "text/event-stream",
+    "application/gzip",
+    "application/zip",
+    "application/zstd",
+    "application/vnd.apache.parquet",
+    "image/",
+    "audio/",
+    "video/",
+)
+
+
+class _GzipCompressor:
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(
+            settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16
+        )
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self) -> None:
+        import brotli  # type: ignore[import-untyped]
+
+        self._compressor = brotli.Compressor(
+            quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+
+    def compress(self, data: bytes) -> bytes:
+        compressed: bytes = self._compressor.process(data)
+        return compressed
+
+    def flush(self) -> bytes:
+        compressed: bytes = self._compressor.flush()
+        return compressed
+
+    def finish(self) -> bytes:
+        compressed: bytes = self._compressor.finish()
+        return compressed
+
+
+class _ZstdCompressor:
+    def __init__(self) -> None:
+        import zstandard
+
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(
+            level=settings.COMPRESSION_ZSTD_LEVEL
+        ).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+_Compressor = _GzipCompressor | _BrotliCompressor | _ZstdCompressor
+
+COMPRESSORS: dict[str, type[_Compressor]] = {
+    "gzip": _GzipCompressor,
+    "br": _BrotliCompressor,
+    "zstd": _ZstdCompressor,
+}
+
+
+def available_encodings(
+    encodings: Sequence[CompressionEncoding],
+) -> list[CompressionEncoding]:
+    return [
+        encoding
+        for encoding in encodings
+        if encoding not in OPTIONAL_MODULES
+        or importlib.util.find_spec(OPTIONAL_MODULES[encoding]) is not None
+    ]
+
+
+def negotiate(accept_encoding: str, encodings: Sequence[str]) -> str | None:
+    """
+    Pick the encoding the client prefers by q-value among `encodings`, which
+    are in the server's order of preference for ties.
+    """
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name := name.strip().lower():
+            accepted[name] = q
+    default = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, default)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _CompressingSender:
+    """
+    Holds back the response start until the first body chunk shows whether
+    the response is worth compressing.
+    """
+
+    def __init__(self, send: Send, *, encoding: str, minimum_size: int) -> None:
+        self._send = send
+        self._encoding = encoding
+        self._minimum_size = minimum_size
+        self._start: Message | None = None
+        self._compressor: _Compressor | None = None
+        self._passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self._passthrough = (
+                "content-encoding" in headers
+                or "no-transform" in headers.get("cache-control", "")
+                or headers.get("content-type", "").startswith(UNCOMPRESSED_MEDIA_TYPES)
+            )
+            if self._passthrough:
+                await self._send(message)
+            else:
+                self._start = message
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+        if self._compressor is None:
+            assert self._start is not None
+            if not more_body and len(body) < self._minimum_size:
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(message)
+                return
+            self._compressor = COMPRESSORS[self._encoding]()
+            message = self._compress(body, more_body)
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["Content-Encoding"] = self._encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                if "content-length" in headers:
+                    del headers["content-length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+            await self._send(self._start)
+        else:
+            message = self._compress(body, more_body)
+        await self._send(message)
+
+    def _compress(self, body: bytes, more_body: bool) -> Message:
+        assert self._compressor is not None
+        data = self._compressor.compress(body)
+        # Streamed chunks are flushed so each one reaches the client right away
+        data += self._compressor.flush() if more_body else self._compressor.finish()
+        return {"type": "http.response.body", "body": data, "more_body": more_body}
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        encodings: Sequence[CompressionEncoding],
+        minimum_size: int,
+    ) -> None:
+        self.app = app
+        self.encodings = available_encodings(encodings)
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = None
+        if scope["type"] == "http":
+            accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+            encoding = negotiate(accept_encoding, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        sender = _CompressingSender(
+            send, encoding=encoding, minimum_size=self.minimum_size
+        )
+        await self.app(scope, receive, sender)
@@ -14,6 +14,9 @@ from pydantic_core import MultiHostUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing_extensions import Self
 
+CountStrategy = Literal["exact", "cached", "estimated"]
+CompressionEncoding = Literal["zstd", "br", "gzip"]
+
 
 def parse_cors(v: Any) -> list[str] | str:
     if isinstance(v, str) and not v.startswith("["):
@@ -32,8 +35,11 @@ class Settings(BaseSettings):
     )
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = secrets.token_urlsafe(32)
-    # 60 minutes * 24 hours * 8 days = 8 days
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Access tokens carry the user's permissions, so they are short lived and
+    # renewed with a refresh token, which re-reads the user. A login session
+    # lasts REFRESH_TOKEN_EXPIRE_DAYS after the last refresh.
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 8
     FRONTEND_HOST: str = "http://localhost:5173"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
@@ -68,6 +74,98 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Connection pool of each engine (sync and async) in each worker process.
+    # Size it so that replicas * workers * 2 * (POOL_SIZE + MAX_OVERFLOW)
+    # stays below Postgres' max_connections.
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30
+    # Seconds after which a connection is replaced, -1 to keep connections forever
+    POSTGRES_POOL_RECYCLE: int = 1800
+    # Test connections on checkout, so a restarted database doesn't fail requests
+    POSTGRES_POOL_PRE_PING: bool = True
+
+    # How list endpoints compute their total `count`, see `crud.count_rows`
+    ITEMS_COUNT_STRATEGY: CountStrategy = "cached"
+    ROOMS_COUNT_STRATEGY: CountStrategy = "cached"
+    USERS_COUNT_STRATEGY: CountStrategy = "exact"
+    COUNT_CACHE_TTL_SECONDS: int = 5
+    # Below this many rows (per pg_class.reltuples) estimates fall back to exact
+    COUNT_ESTIMATE_MIN_ROWS: int = 100_000
+
+    # Rows inserted per multi-row INSERT by POST /items/bulk
+    ITEMS_BULK_BATCH_SIZE: int = 1000
+    ITEMS_BULK_MAX_ERRORS: int = 100
+    # Longer lines, and CSV quoted fields spanning more lines, are rejected
+    ITEMS_BULK_MAX_LINE_BYTES: int = 64 * 1024
+    ITEMS_BULK_MAX_RECORD_LINES: int = 100
+
+    # Rows fetched per round trip by the /export endpoints' server-side cursor
+    EXPORT_YIELD_PER: int = 1000
+
+    # GET /items/events: each worker LISTENs on one connection and fans events
+    # out to its subscribers. A subscriber more than ITEM_EVENTS_QUEUE_SIZE
+    # events behind is disconnected, and should refetch after reconnecting.
+    ITEM_EVENTS_QUEUE_SIZE: int = 100
+    ITEM_EVENTS_HEARTBEAT_SECONDS: float = 15
+    # Streams end after this long, and clients reconnect, so open streams don't
+    # hold up worker restarts and spread over the workers again
+    ITEM_EVENTS_MAX_STREAM_SECONDS: float = 300
+
+    # Responses of at least COMPRESSION_MINIMUM_SIZE bytes are compressed with
+    # the first of COMPRESSION_ENCODINGS the client accepts. br and zstd need
+    # the `compression` extra and are skipped when it isn't installed.
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: list[CompressionEncoding] = ["zstd", "br", "gzip"]
+    COMPRESSION_MINIMUM_SIZE: int = 1000
+    # Levels trading ratio for CPU suited to responses compressed per request
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+    # Prometheus metrics at /metrics, outside of API_V1_STR. The proxy in
+    # docker-compose.yml doesn't route it. With METRICS_TOKEN set, scrapes must
+    # also send it as a bearer token. See app/core/metrics.py for running
+    # several workers.
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str | None = None
+    # Responses report the database queries run and their time in a
+    # Server-Timing header, shown by browser dev tools
+    SERVER_TIMING: bool = True
+    # Log a warning for each statement a request runs QUERY_DEBUG_REPEATS
+    # times or more, likely an N+1 query. Meant for development.
+    QUERY_DEBUG: bool = False
+    QUERY_DEBUG_REPEATS: int = 5
+
+    # Authenticated users are cached by id, so auth doesn't hit the database.
+    # Without CACHE_REDIS_URL each worker has its own cache, and other workers
+    # see permission changes only once their entry expires.
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 10_000
+    # Decoded access token claims are cached by token, never past its expiry,
+    # so auth skips verifying the signature of tokens it has seen recently
+    TOKEN_CACHE_TTL_SECONDS: int = 300
+    TOKEN_CACHE_MAX_SIZE: int = 10_000
+    # Optional Redis shared by all workers for caches, e.g. redis://redis:6379/0
+    CACHE_REDIS_URL: str | None = None
+
+    # Password hashing policy. Hashes made with another scheme or other costs
+    # are rehashed on the next successful login. Run
+    # `python -m app.calibrate_password_hashing` to pick costs for a target
+    # verify latency on the current hardware.
+    PASSWORD_HASH_SCHEME: Literal["argon2", "bcrypt"] = "argon2"
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_TIME_COST: int = 2
+    ARGON2_MEMORY_COST: int = 19_456  # KiB
+    ARGON2_PARALLELISM: int = 1
+
+    # Password hashing runs in a process pool in each worker, so it uses every
+    # core without holding threadpool slots other endpoints need
+    PASSWORD_HASHING_WORKERS: int = 2
+    # Hashing jobs allowed in flight per worker before requests get a 429
+    PASSWORD_HASHING_MAX_PENDING: int = 64
+    PASSWORD_HASHING_RETRY_AFTER_SECONDS: int = 1
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -85,6 +183,18 @@ class Settings(BaseSettings):
         return self
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
+    SMTP_TIMEOUT_SECONDS: int = 10
+    # Emails are queued in the outbox table and sent in the background by a
+    # dispatcher in each worker, in batches over one reused SMTP connection.
+    # Failed sends are retried with exponential backoff, from
+    # EMAIL_RETRY_BASE_SECONDS up to EMAIL_RETRY_MAX_SECONDS, and given up
+    # ("dead") after EMAIL_MAX_ATTEMPTS or when the server rejects them.
+    EMAIL_DISPATCHER_ENABLED: bool = True
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50
+    EMAIL_OUTBOX_POLL_SECONDS: int = 5
+    EMAIL_MAX_ATTEMPTS: int = 8
+    EMAIL_RETRY_BASE_SECONDS: int = 30
+    EMAIL_RETRY_MAX_SECONDS: int = 3600
 
     @computed_field  # type: ignore[prop-decorator]
     @property
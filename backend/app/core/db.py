@@ -1,10 +1,79 @@
+import time
+from typing import Any
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.core.queries import instrument_engine
+from app.models import DatabasePoolStats, User, UserCreate
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait to check out a connection,
+    including opening a new one when the pool grows into its overflow.
+    """
+
+    checkout_count = 0
+    checkout_wait_seconds = 0.0
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_count += 1
+            self.checkout_wait_seconds += time.perf_counter() - start
+
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+pool_options: dict[str, Any] = {
+    "pool_size": settings.POSTGRES_POOL_SIZE,
+    "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+    "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+    "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+    "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+}
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedQueuePool,
+    **pool_options,
+)
+# Same database through psycopg's async driver, for routes running on the event loop
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    **pool_options,
+)
+# Queries per request, for Server-Timing, metrics and N+1 warnings
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+
+def get_pool_stats() -> list[DatabasePoolStats]:
+    stats = []
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        assert isinstance(pool, InstrumentedQueuePool)
+        stats.append(
+            DatabasePoolStats(
+                engine=name,
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                # Negative while the pool hasn't opened `size` connections yet
+                overflow=max(pool.overflow(), 0),
+                max_overflow=settings.POSTGRES_MAX_OVERFLOW,
+                checkout_count=pool.checkout_count,
+                checkout_wait_seconds=pool.checkout_wait_seconds,
+            )
+        )
+    return stats
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -0,0 +1,273 @@
+"""
+Item events shared by every worker through Postgres LISTEN/NOTIFY.
+
+Writers queue events with `publish_item_events` inside their transaction, so
+Postgres delivers them on commit and never for rolled back changes. Each
+worker keeps one LISTEN connection, opened by its first subscriber, and fans
+events out to its subscribers' queues.
+"""
+
+import asyncio
+import itertools
+import logging
+import uuid
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator, Sequence
+from contextlib import suppress
+from typing import Any
+
+import psycopg
+from sqlalchemy import make_url, text
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import Item, ItemEvent, ItemEventKind
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "item_events"
+
+# SSE comment line, sent to idle streams so proxies keep them open
+HEARTBEAT = b": keep-alive\n\n"
+
+_notify_statement = text(f"SELECT pg_notify('{CHANNEL}', :payload)")
+
+
+def item_event(
+    event: ItemEventKind, item: Item, *, user_id: uuid.UUID | None = None
+) -> ItemEvent:
+    return ItemEvent(
+        event=event,
+        item_id=item.item_id,
+        current_room=item.current_room,
+        user_id=user_id,
+        is_available=item.is_available,
+    )
+
+
+def bulk_created_events(items: Sequence[Item]) -> list[ItemEvent]:
+    """
+    One `bulk_created` event per room of `items`, rather than one per item,
+    so a bulk import sends a handful of notifications per batch.
+    """
+    counts = Counter(item.current_room for item in items)
+    return [
+        ItemEvent(event="bulk_created", current_room=room, count=count)
+        for room, count in counts.items()
+    ]
+
+
+def _notify_params(events: Sequence[ItemEvent]) -> list[dict[str, Any]]:
+    return [{"payload": event.model_dump_json()} for event in events]
+
+
+def publish_item_events(session: Session, events: Sequence[ItemEvent]) -> None:
+    """
+    Queue `events` in the session's transaction, listeners get them on commit.
+    """
+    if events:
+        session.exec(_notify_statement, params=_notify_params(events))  # type: ignore[call-overload]
+
+
+async def publish_item_events_async(
+    session: AsyncSession, events: Sequence[ItemEvent]
+) -> None:
+    if events:
+        await session.exec(_notify_statement, params=_notify_params(events))  # type: ignore[call-overload]
+
+
+class Subscriber:
+    def __init__(self, *, room: str | None, user_id: uuid.UUID | None) -> None:
+        self.room = room
+        self.user_id = user_id
+        # Encoded SSE frames, None once the broker dropped the subscriber
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(
+            settings.ITEM_EVENTS_QUEUE_SIZE
+        )
+
+    def matches(self, event: ItemEvent) -> bool:
+        return (self.room is None or event.current_room == self.room) and (
+            self.user_id is None or event.user_id == self.user_id
+        )
+
+
+class ItemEventBroker:
+    """
+    Fans out the item events of the LISTEN connection to this worker's
+    subscribers.
+
+    Subscribers are indexed by room, else by user, so an event is only matched
+    against the subscribers that can want it.
+    """
+
+    def __init__(self) -> None:
+        self._everything: set[Subscriber] = set()
+        self._by_room: defaultdict[str, set[Subscriber]] = defaultdict(set)
+        self._by_user: defaultdict[uuid.UUID, set[Subscriber]] = defaultdict(set)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._listener: asyncio.Task[None] | None = None
+        self._ready: asyncio.Future[None] | None = None
+
+    def __len__(self) -> int:
+        return (
+            len(self._everything)
+            + sum(map(len, self._by_room.values()))
+            + sum(map(len, self._by_user.values()))
+        )
+
+    def _index(self, subscriber: Subscriber) -> set[Subscriber]:
+        if subscriber.room is not None:
+            return self._by_room[subscriber.room]
+        if subscriber.user_id is not None:
+            return self._by_user[subscriber.user_id]
+        return self._everything
+
+    async def subscribe(
+        self, *, room: str | None = None, user_id: uuid.UUID | None = None
+    ) -> Subscriber:
+        """
+        Register a subscriber once this worker is listening, so it gets every
+        event committed from now on. Call `unsubscribe` when done with it.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues and the listener belong to the loop they were made on
+            self._forget_loop()
+            self._loop = loop
+        if self._listener is None or self._listener.done():
+            self._ready = loop.create_future()
+            self._listener = asyncio.create_task(self._listen(self._ready))
+        assert self._ready is not None
+        await asyncio.shield(self._ready)
+        subscriber = Subscriber(room=room, user_id=user_id)
+        self._index(subscriber).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        index = self._index(subscriber)
+        index.discard(subscriber)
+        if not index and index is not self._everything:
+            if subscriber.room is not None:
+                self._by_room.pop(subscriber.room, None)
+            elif subscriber.user_id is not None:
+                self._by_user.pop(subscriber.user_id, None)
+
+    def _drop(self, subscriber: Subscriber) -> None:
+        self.unsubscribe(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def _drop_all(self) -> None:
+        for subscriber in list(self._subscribers()):
+            self._drop(subscriber)
+
+    def _subscribers(self) -> itertools.chain[Subscriber]:
+        return itertools.chain(
+            self._everything,
+            *self._by_room.values(),
+            *self._by_user.values(),
+        )
+
+    def _forget_loop(self) -> None:
+        if (
+            self._listener is not None
+            and self._loop is not None
+            and not self._loop.is_closed()
+        ):
+            self._loop.call_soon_threadsafe(self._listener.cancel)
+        self._listener = None
+        self._ready = None
+        self._everything.clear()
+        self._by_room.clear()
+        self._by_user.clear()
+
+    async def _listen(self, ready: asyncio.Future[None]) -> None:
+        conninfo = make_url(str(settings.SQLALCHEMY_DATABASE_URI)).set(
+            drivername="postgresql"
+        )
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                conninfo.render_as_string(hide_password=False), autocommit=True
+            ) as connection:
+                await connection.execute(f"LISTEN {CHANNEL}")
+                ready.set_result(None)
+                while True:
+                    async for notify in connection.notifies(
+                        timeout=settings.ITEM_EVENTS_HEARTBEAT_SECONDS
+                    ):
+                        self.dispatch(notify.payload)
+                    self._heartbeat()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.exception("Lost the item events connection")
+        finally:
+            if not ready.done():
+                ready.cancel()
+            if self._listener is asyncio.current_task():
+                # Events may have been missed, subscribers reconnect and refetch
+                self._drop_all()
+
+    def dispatch(self, payload: str) -> None:
+        event = ItemEvent.model_validate_json(payload)
+        # Encoded once, whatever the number of subscribers
+        frame = f"event: {event.event}\ndata: {payload}\n\n".encode()
+        candidates = itertools.chain(
+            self._everything,
+            self._by_room.get(event.current_room, ()) if event.current_room else (),
+            self._by_user.get(event.user_id, ()) if event.user_id else (),
+        )
+        lagging = []
+        for subscriber in candidates:
+            if not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                lagging.append(subscriber)
+        for subscriber in lagging:
+            self._drop(subscriber)
+
+    def _heartbeat(self) -> None:
+        # One timer for all subscribers, rather than one per stream
+        for subscriber in self._subscribers():
+            with suppress(asyncio.QueueFull):
+                subscriber.queue.put_nowait(HEARTBEAT)
+
+    async def close(self) -> None:
+        """
+        End every subscriber's stream and stop listening.
+        """
+        listener = self._listener
+        self._listener = None
+        self._ready = None
+        self._drop_all()
+        if listener is not None:
+            listener.cancel()
+            with suppress(asyncio.CancelledError):
+                await listener
+
+
+broker = ItemEventBroker()
+
+
+async def event_stream(subscriber: Subscriber) -> AsyncIterator[bytes]:
+    """
+    Server-Sent Events of `subscriber`, until the broker drops it or the stream
+    is ITEM_EVENTS_MAX_STREAM_SECONDS old. Unsubscribes when the client leaves.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.ITEM_EVENTS_MAX_STREAM_SECONDS
+    try:
+        # Reconnect after a second when the stream ends
+        yield b"retry: 1000\n: subscribed\n\n"
+        # Heartbeats wake every stream regularly, so the deadline is checked
+        while (frame := await subscriber.queue.get()) is not None:
+            yield frame
+            if loop.time() >= deadline:
+                return
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,131 @@
+"""
+Prometheus metrics, served at /metrics.
+
+With several workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+shared by them, before they start: each worker then writes its samples
+there and /metrics, whichever worker serves it, reports all of them
+aggregated. Without it, /metrics only reports the worker serving it.
+"""
+
+import os
+import secrets
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.queries import query_stats
+
+if multiproc_dir := os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # Metrics open their file there as soon as they are created, below
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, by route id and status code.",
+    ["route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests being served.",
+    multiprocess_mode="livesum",
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries run to serve a request, by route id.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Time spent running database queries to serve a request, by route id.",
+    ["route"],
+)
+PASSWORD_HASHING_SECONDS = Histogram(
+    "password_hashing_seconds",
+    "Time to hash or verify a password in the hashing pool, queueing included.",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ITEM_OPERATIONS = Counter(
+    "item_operations",
+    "Items taken or released, and attempts rejected because the item was "
+    "unavailable or not held.",
+    ["operation", "outcome"],
+)
+
+
+def route_label(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        # Not found, bounded to one series whatever the paths requested
+        return "unmatched"
+    label: str = getattr(route, "unique_id", None) or route.path
+    return label
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            route = route_label(scope)
+            REQUEST_DURATION.labels(route=route, status=str(status)).observe(elapsed)
+            # Tracked by QueryStatsMiddleware, which wraps this one
+            stats = query_stats.get()
+            if stats is not None:
+                REQUEST_DB_QUERIES.labels(route=route).observe(stats.count)
+                REQUEST_DB_SECONDS.labels(route=route).observe(stats.seconds)
+
+
+def metrics(request: Request) -> Response:
+    token = settings.METRICS_TOKEN
+    if token is not None and not secrets.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()
+    ):
+        return Response(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead() -> None:
+    """
+    Drop this worker's in-progress gauge when it exits, its other samples are
+    kept in the totals.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())  # type: ignore[no-untyped-call]
@@ -0,0 +1,241 @@
+"""
+Email outbox: requests queue emails in the `outboxemail` table, in their own
+transaction, and a dispatcher in each worker sends them in the background.
+
+Dispatchers claim due emails with FOR UPDATE SKIP LOCKED, so workers share
+the outbox without sending an email twice, and send each batch over one SMTP
+connection, kept open while the outbox has more to send.
+"""
+
+import asyncio
+import logging
+import random
+import smtplib
+from contextlib import suppress
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+
+from sqlmodel import Session, col, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(
+    session: Session, *, email_to: str, subject: str, html_content: str
+) -> OutboxEmail:
+    """
+    Add an email to the outbox in the session's transaction, it's sent once
+    committed. Call `dispatcher.wake()` after committing to send it right away.
+    """
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    email = OutboxEmail(email_to=email_to, subject=subject, html_content=html_content)
+    session.add(email)
+    return email
+
+
+def build_message(email: OutboxEmail) -> EmailMessage:
+    assert settings.EMAILS_FROM_EMAIL is not None
+    message = EmailMessage()
+    message["Subject"] = email.subject
+    message["From"] = formataddr(
+        (settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL)
+    )
+    message["To"] = email.email_to
+    # The same on every attempt, so receivers can drop duplicates
+    domain = settings.EMAILS_FROM_EMAIL.rpartition("@")[2]
+    message["Message-ID"] = f"<{email.id}@{domain}>"
+    message.set_content(email.html_content, subtype="html")
+    return message
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff with jitter, so emails that failed together don't all
+    retry at the same time.
+    """
+    delay = min(
+        settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        settings.EMAIL_RETRY_MAX_SECONDS,
+    )
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def is_permanent(error: Exception) -> bool:
+    # 5xx replies won't change on retry, 4xx ones are temporary
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class SMTPUnavailableError(Exception):
+    """
+    The SMTP server can't be reached or logged into, whatever the message.
+    """
+
+
+class SMTPConnection:
+    """
+    An SMTP connection opened for the first message and reused for the next
+    ones until closed.
+    """
+
+    def __init__(self) -> None:
+        self._smtp: smtplib.SMTP | None = None
+
+    def _connect(self) -> smtplib.SMTP:
+        assert settings.SMTP_HOST is not None
+        smtp_class: type[smtplib.SMTP] = (
+            smtplib.SMTP_SSL if settings.SMTP_SSL else smtplib.SMTP
+        )
+        smtp = smtp_class(
+            settings.SMTP_HOST,
+            settings.SMTP_PORT,
+            timeout=settings.SMTP_TIMEOUT_SECONDS,
+        )
+        try:
+            if settings.SMTP_TLS and not settings.SMTP_SSL:
+                smtp.starttls()
+            if settings.SMTP_USER:
+                smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD or "")
+        except BaseException:
+            smtp.close()
+            raise
+        return smtp
+
+    def _open(self) -> smtplib.SMTP:
+        if self._smtp is None:
+            try:
+                self._smtp = self._connect()
+            except OSError as e:
+                raise SMTPUnavailableError(str(e)) from e
+        return self._smtp
+
+    def send(self, message: EmailMessage) -> None:
+        """
+        Send `message`, raising SMTPUnavailableError for connection failures
+        and smtplib's errors for replies about this message.
+        """
+        for reconnected in (False, True):
+            smtp = self._open()
+            try:
+                smtp.send_message(message)
+                return
+            except smtplib.SMTPServerDisconnected as e:
+                self.close()
+                # Servers close connections left idle, reconnect once
+                if reconnected:
+                    raise SMTPUnavailableError(str(e)) from e
+            except smtplib.SMTPException:
+                raise
+            except OSError as e:
+                self.close()
+                raise SMTPUnavailableError(str(e)) from e
+
+    def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            with suppress(OSError):
+                smtp.quit()
+            smtp.close()
+
+
+class EmailDispatcher:
+    def __init__(self) -> None:
+        self.smtp = SMTPConnection()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def dispatch_batch(self) -> int:
+        """
+        Send the next EMAIL_OUTBOX_BATCH_SIZE due emails. Blocking, returns how
+        many were due.
+        """
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            statement = (
+                select(OutboxEmail)
+                .where(
+                    OutboxEmail.status == "pending",
+                    col(OutboxEmail.next_attempt_at) <= now,
+                )
+                .order_by(col(OutboxEmail.next_attempt_at))
+                .limit(settings.EMAIL_OUTBOX_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            emails = session.exec(statement).all()
+            unavailable: SMTPUnavailableError | None = None
+            for email in emails:
+                error: Exception | None = unavailable
+                if error is None:
+                    try:
+                        self.smtp.send(build_message(email))
+                    except SMTPUnavailableError as e:
+                        # Leave the rest of the batch for the next attempt
+                        # rather than wait for the server once per email
+                        error = unavailable = e
+                    except smtplib.SMTPException as e:
+                        error = e
+                if error is None:
+                    session.delete(email)
+                else:
+                    self._failed(email, error, now=now)
+                    session.add(email)
+            session.commit()
+        return len(emails)
+
+    def _failed(self, email: OutboxEmail, error: Exception, *, now: datetime) -> None:
+        email.attempts += 1
+        email.last_error = f"{type(error).__name__}: {error}"
+        if is_permanent(error) or email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            email.status = "dead"
+            logger.error("Gave up sending email %s: %s", email.id, error)
+        else:
+            email.next_attempt_at = now + retry_delay(email.attempts)
+
+    def wake(self) -> None:
+        """
+        Dispatch now instead of at the next poll. Safe to call from any thread.
+        """
+        if self._loop is not None and self._wake is not None:
+            with suppress(RuntimeError):
+                self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(self._wake))
+
+    async def _run(self, wake: asyncio.Event) -> None:
+        while True:
+            wake.clear()
+            try:
+                due = await asyncio.to_thread(self.dispatch_batch)
+            except Exception:
+                logger.exception("Failed to dispatch emails")
+                due = 0
+            if due >= settings.EMAIL_OUTBOX_BATCH_SIZE:
+                continue
+            # Nothing more to send for now, don't keep the server waiting
+            await asyncio.to_thread(self.smtp.close)
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    wake.wait(), timeout=settings.EMAIL_OUTBOX_POLL_SECONDS
+                )
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        self._loop = self._wake = None
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await asyncio.to_thread(self.smtp.close)
+
+
+dispatcher = EmailDispatcher()
@@ -0,0 +1,133 @@
+"""
+Database queries run per request, counted with cursor events on the engines.
+
+`QueryStatsMiddleware` reports them to the client in a Server-Timing header,
+and with QUERY_DEBUG logs statements repeated within a request, the usual
+sign of an N+1 query: a statement run once per row of a previous one.
+"""
+
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any
+
+from sqlalchemy import Engine, event
+from sqlalchemy.engine import ExceptionContext
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """
+    Database queries run on behalf of one request. `statements` counts them by
+    SQL text, only when tracking repeated statements.
+    """
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self, *, track_statements: bool = False) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter[str] | None = Counter() if track_statements else None
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Statements run at least `threshold` times, most run first.
+        """
+        if self.statements is None:
+            return []
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+# Set per request by the middleware. Sync routes run in the threadpool with a
+# copy of the context, which shares the same QueryStats.
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn: Any, *_args: Any) -> None:
+    # A connection runs one statement at a time, so one slot is enough
+    conn.info["query_started_at"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn: Any, _cursor: Any, statement: str, *_args: Any) -> None:
+    elapsed = time.perf_counter() - conn.info.pop("query_started_at")
+    stats = query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        if stats.statements is not None:
+            # Parameters are bound separately, so the text is the same for
+            # every row of an N+1
+            stats.statements[statement] += 1
+
+
+def _handle_error(context: ExceptionContext) -> None:
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        context.connection.info.pop("query_started_at", None)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Count the queries `engine` runs, and their time, for the current request.
+    For an async engine pass its `sync_engine`.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def server_timing(stats: QueryStats, elapsed: float) -> str:
+    queries = "query" if stats.count == 1 else "queries"
+    return (
+        f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} {queries}", '
+        f"app;dur={elapsed * 1000:.1f}"
+    )
+
+
+class QueryStatsMiddleware:
+    """
+    Tracks the queries of each request in `query_stats`. Responses get a
+    Server-Timing header with the queries run until the response started,
+    which for streamed responses leaves out those run while streaming.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats(track_statements=settings.QUERY_DEBUG)
+        start = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and settings.SERVER_TIMING:
+                headers = MutableHeaders(scope=message)
+                elapsed = time.perf_counter() - start
+                headers.append("Server-Timing", server_timing(stats, elapsed))
+            await send(message)
+
+        token = query_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            query_stats.reset(token)
+            for statement, count in stats.repeated(settings.QUERY_DEBUG_REPEATS):
+                logger.warning(
+                    "Possible N+1: %s %s ran this statement %d times: %s",
+                    scope["method"],
+                    scope["path"],
+                    count,
+                    statement,
+                )
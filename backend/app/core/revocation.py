@@ -0,0 +1,113 @@
+"""
+Access tokens revoked before they expire, checked on every request without
+querying the database.
+
+Revocations are stored in the `revokedtoken` table and announced with NOTIFY
+in the same transaction. Each worker loads the table when it starts and then
+LISTENs for revocations made by any worker, so a revoked token is rejected
+everywhere at once.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from datetime import datetime, timezone
+
+import psycopg
+from sqlalchemy import make_url
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "token_revocations"
+
+# Seconds to wait before reconnecting after losing the LISTEN connection
+RECONNECT_DELAY = 1
+
+
+def notify_payload(token_id: str, expires_at: float) -> str:
+    return f"{token_id} {expires_at}"
+
+
+def _timestamp(expires_at: datetime) -> float:
+    # Stored as naive UTC, like every datetime of the models
+    return expires_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RevocationList:
+    """
+    This worker's set of revoked token ids, with their expiry so entries can
+    be dropped once the tokens would be rejected anyway.
+    """
+
+    def __init__(self) -> None:
+        self._revoked: dict[str, float] = {}
+        self._listener: asyncio.Task[None] | None = None
+
+    def __contains__(self, token_id: str) -> bool:
+        return token_id in self._revoked
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def add(self, token_id: str, expires_at: float) -> None:
+        now = time.time()
+        if expires_at > now:
+            self._revoked[token_id] = expires_at
+        # Revocations are rare, pruning on each one keeps the set small
+        for expired in [key for key, at in self._revoked.items() if at <= now]:
+            del self._revoked[expired]
+
+    async def start(self) -> None:
+        """
+        Load the revoked tokens and keep listening for new revocations. Returns
+        once loaded, so no revoked token is accepted in the meantime.
+        """
+        ready = asyncio.get_running_loop().create_future()
+        self._listener = asyncio.create_task(self._listen(ready))
+        await ready
+
+    async def _listen(self, ready: asyncio.Future[None]) -> None:
+        conninfo = make_url(str(settings.SQLALCHEMY_DATABASE_URI)).set(
+            drivername="postgresql"
+        )
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    conninfo.render_as_string(hide_password=False), autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {CHANNEL}")
+                    # Loaded once listening, so no revocation falls in between
+                    await self._load(connection)
+                    if not ready.done():
+                        ready.set_result(None)
+                    async for notify in connection.notifies():
+                        token_id, _, expires_at = notify.payload.partition(" ")
+                        self.add(token_id, float(expires_at))
+            except Exception as e:
+                if not ready.done():
+                    ready.set_exception(e)
+                    return
+                logger.exception("Lost the token revocations connection")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _load(self, connection: psycopg.AsyncConnection) -> None:
+        cursor = await connection.execute(
+            "SELECT token_id, expires_at FROM revokedtoken WHERE expires_at > %s",
+            (datetime.utcnow(),),
+        )
+        for token_id, expires_at in await cursor.fetchall():
+            self._revoked[token_id] = _timestamp(expires_at)
+
+    async def close(self) -> None:
+        listener = self._listener
+        self._listener = None
+        if listener is not None:
+            listener.cancel()
+            with suppress(asyncio.CancelledError):
+                await listener
+
+
+revocations = RevocationList()
@@ -1,3 +1,10 @@
+import asyncio
+import hashlib
+import multiprocessing
+import secrets
+import uuid
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
@@ -5,23 +12,156 @@ import jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import PASSWORD_HASHING_SECONDS
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def make_pwd_context(
+    *,
+    scheme: str,
+    bcrypt_rounds: int,
+    argon2_time_cost: int,
+    argon2_memory_cost: int,
+    argon2_parallelism: int,
+) -> CryptContext:
+    """
+    Hash with `scheme` and flag any other scheme, or other costs, as needing an
+    update. Pinning min and max rounds to the configured cost makes passlib
+    report hashes that are weaker or slower than the policy alike.
+    """
+    return CryptContext(
+        schemes=[scheme, *(other for other in ("argon2", "bcrypt") if other != scheme)],
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__min_rounds=argon2_time_cost,
+        argon2__max_rounds=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+
+pwd_context = make_pwd_context(
+    scheme=settings.PASSWORD_HASH_SCHEME,
+    bcrypt_rounds=settings.BCRYPT_ROUNDS,
+    argon2_time_cost=settings.ARGON2_TIME_COST,
+    argon2_memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2_parallelism=settings.ARGON2_PARALLELISM,
+)
 
 
 ALGORITHM = "HS256"
 
 
-def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta,
+    *,
+    permissions: Sequence[str] = (),
+    session_id: str | None = None,
+) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+    # The token id, by which it can be revoked
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "jti": uuid.uuid4().hex,
+        "perms": list(permissions),
+    }
+    if session_id is not None:
+        to_encode["sid"] = session_id
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def create_refresh_token() -> tuple[str, str]:
+    """
+    A new opaque refresh token and the hash to store instead of it.
+    """
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are random, a fast hash is enough to not store them as is
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """
+    Verify a password and, when its hash is out of policy, return a new hash.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+class HashingOverloadedError(Exception):
+    """
+    Too many password hashing jobs are already in flight in this worker.
+    """
+
+
+_hashing_executor: ProcessPoolExecutor | None = None
+_hashing_pending = 0
+
+
+def get_hashing_executor() -> ProcessPoolExecutor:
+    global _hashing_executor
+    if _hashing_executor is None:
+        # Spawn instead of fork: the server process already runs threads
+        _hashing_executor = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASHING_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hashing_executor
+
+
+def shutdown_hashing_executor() -> None:
+    global _hashing_executor
+    if _hashing_executor is not None:
+        _hashing_executor.shutdown(cancel_futures=True)
+        _hashing_executor = None
+
+
+async def _run_hashing(operation: str, func: Any, *args: Any) -> Any:
+    global _hashing_pending
+    if _hashing_pending >= settings.PASSWORD_HASHING_MAX_PENDING:
+        raise HashingOverloadedError()
+    _hashing_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        with PASSWORD_HASHING_SECONDS.labels(operation=operation).time():
+            return await loop.run_in_executor(get_hashing_executor(), func, *args)
+    finally:
+        _hashing_pending -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    result: bool = await _run_hashing(
+        "verify", verify_password, plain_password, hashed_password
+    )
+    return result
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    result: tuple[bool, str | None] = await _run_hashing(
+        "verify", verify_and_update_password, plain_password, hashed_password
+    )
+    return result
+
+
+async def get_password_hash_async(password: str) -> str:
+    result: str = await _run_hashing("hash", get_password_hash, password)
+    return result
@@ -1,10 +1,168 @@
+import re
 import uuid
+from collections.abc import Sequence
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import REAL, ColumnElement, delete, literal, literal_column, or_, text
+from sqlalchemy.dialects.postgresql import TSQUERY
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session, SQLModel, col, func, select
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate, RoomCreate, Room
+from app.core.cache import make_cache
+from app.core.config import CountStrategy, settings
+from app.core.events import item_event, publish_item_events
+from app.core.security import get_password_hash, verify_and_update_password
+from app.models import (
+    Item,
+    ItemCreate,
+    ItemFilters,
+    RefreshToken,
+    Room,
+    RoomCreate,
+    User,
+    UserCreate,
+    UserUpdate,
+)
+
+# Cached totals for list endpoints, keyed by table name. Entries are dropped by
+# `invalidate_count` on create/delete; without a shared cache other workers
+# converge within COUNT_CACHE_TTL_SECONDS.
+count_cache = make_cache(
+    namespace="count", maxsize=128, ttl=settings.COUNT_CACHE_TTL_SECONDS
+)
+# Column values of users by id, see `get_user`
+user_cache = make_cache(
+    namespace="user",
+    maxsize=settings.USER_CACHE_MAX_SIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+)
+reltuples_statement = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)"
+)
+
+
+def count_rows(
+    *,
+    session: Session,
+    model: type[SQLModel],
+    strategy: CountStrategy,
+    filters: Sequence[ColumnElement[bool]] = (),
+) -> int:
+    """
+    Count the rows of `model`'s table.
+
+    - `exact` runs `SELECT count(*)` every time.
+    - `cached` reuses an exact count for COUNT_CACHE_TTL_SECONDS.
+    - `estimated` reads the planner's `pg_class.reltuples` statistic, which is
+      free but only as fresh as the last (auto)vacuum/analyze. Small tables are
+      counted exactly, where estimates are both cheap to beat and least accurate.
+
+    Rows matching `filters` are always counted exactly, their indexes keep
+    that cheap and a cached or estimated total would be wrong.
+    """
+    table_name = model.__tablename__
+    if filters:
+        strategy = "exact"
+    if strategy == "estimated":
+        estimate = session.exec(  # type: ignore[call-overload]
+            reltuples_statement, params={"table_name": f'"{table_name}"'}
+        ).scalar_one()
+        if estimate >= settings.COUNT_ESTIMATE_MIN_ROWS:
+            return int(estimate)
+        strategy = "cached"
+    if strategy == "cached":
+        count: int | None = count_cache.get(table_name)
+        if count is not None:
+            return count
+    statement = select(func.count()).select_from(model).where(*filters)
+    count = session.exec(statement).one()
+    if strategy == "cached":
+        count_cache.set(table_name, count)
+    return count
+
+
+def item_filters(filters: ItemFilters) -> list[ColumnElement[bool]]:
+    """
+    Build WHERE clauses for the filters that are set, each backed by an index.
+    """
+    return [
+        col(getattr(Item, name)) == value
+        for name, value in filters.model_dump(exclude_none=True).items()
+    ]
+
+
+def item_search(q: str) -> tuple[ColumnElement[bool], ColumnElement[float]]:
+    """
+    Build the match condition and relevance score of items for a search query.
+
+    Every word of `q` is matched as a prefix against the full-text document of
+    name, vendor and parameters, and `q` is also fuzzily matched against the
+    name with pg_trgm word similarity, which tolerates typos. Both conditions
+    are backed by a GIN index.
+    """
+    terms = re.findall(r"\w+", q)
+    document = Item.__table__.c.search_vector  # type: ignore[attr-defined]
+    tsquery = func.to_tsquery(
+        literal_column("'english'::regconfig"),
+        " & ".join(f"{term}:*" for term in terms),
+        type_=TSQUERY,
+    )
+    match = or_(
+        document.op("@@")(tsquery),
+        literal(q).op("<%")(col(Item.item_name)),
+    )
+    rank: ColumnElement[float] = func.ts_rank(document, tsquery, type_=REAL())
+    similarity: ColumnElement[float] = func.word_similarity(
+        q, col(Item.item_name), type_=REAL()
+    )
+    return match, rank + similarity
+
+
+def invalidate_count(model: type[SQLModel]) -> None:
+    count_cache.delete(model.__tablename__)
+
+
+def attach_cached_user(*, session: Session, data: dict[str, Any]) -> User:
+    """
+    Rebuild a cached user and attach it to `session` as if it had just been
+    loaded, without querying the database. Each call returns a new instance,
+    so requests never share ORM objects.
+    """
+    # The password hash isn't cached, it's loaded if the user is verified
+    user = User.model_validate({**data, "hashed_password": ""})
+    make_transient_to_detached(user)
+    session.add(user)
+    session.expire(user, ["hashed_password"])
+    return user
+
+
+def user_from_cache(*, session: Session, user_id: uuid.UUID | str) -> User | None:
+    data = user_cache.get(str(user_id))
+    if data is None:
+        return None
+    return attach_cached_user(session=session, data=data)
+
+
+def cached_user_data(user: User) -> dict[str, Any]:
+    # Without the password hash, the cache may be shared through Redis
+    return user.model_dump(mode="json", exclude={"hashed_password"})
+
+
+def cache_user(user: User) -> None:
+    user_cache.set(str(user.user_id), cached_user_data(user))
+
+
+def invalidate_user(user_id: uuid.UUID | str) -> None:
+    user_cache.delete(str(user_id))
+
+
+def get_user(*, session: Session, user_id: uuid.UUID | str) -> User | None:
+    user = user_from_cache(session=session, user_id=user_id)
+    if user is None:
+        user = session.get(User, user_id)
+        if user is not None:
+            cache_user(user)
+    return user
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -14,6 +172,7 @@ def create_user(*, session: Session, user_create: UserCreate) -> User:
     session.add(db_obj)
     session.commit()
     session.refresh(db_obj)
+    invalidate_count(User)
     return db_obj
 
 
@@ -26,11 +185,23 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
         extra_data["hashed_password"] = hashed_password
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
+    if "password" in user_data or user_data.get("is_active") is False:
+        end_user_sessions(session=session, user_id=db_user.user_id)
     session.commit()
+    invalidate_user(db_user.user_id)
     session.refresh(db_user)
     return db_user
 
 
+def end_user_sessions(*, session: Session, user_id: uuid.UUID) -> None:
+    """
+    End every login session of a user, in the caller's transaction, when their
+    password changes or they are deactivated. Access tokens already issued
+    last until they expire.
+    """
+    session.exec(delete(RefreshToken).where(col(RefreshToken.user_id) == user_id))  # type: ignore[call-overload]
+
+
 def get_user_by_email(*, session: Session, email: str) -> User | None:
     statement = select(User).where(User.email == email)
     session_user = session.exec(statement).first()
@@ -41,21 +212,33 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    verified, new_hash = verify_and_update_password(password, db_user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        # Stored hash is out of policy, upgrade it while we have the password
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        session.commit()
+        invalidate_user(db_user.user_id)
+        session.refresh(db_user)
     return db_user
 
 
 def create_item(*, session: Session, item_in: ItemCreate) -> Item:
     db_item = Item.model_validate(item_in, update={"current_owner_id": None})
     session.add(db_item)
+    publish_item_events(session, [item_event("created", db_item)])
     session.commit()
     session.refresh(db_item)
+    invalidate_count(Item)
     return db_item
 
+
 def create_room(*, session: Session, room_in: RoomCreate) -> Room:
     db_room = Room.model_validate(room_in)
     session.add(db_room)
     session.commit()
     session.refresh(db_room)
+    invalidate_count(Room)
     return db_room
@@ -0,0 +1,450 @@
+"""
+Async counterparts of `app.crud`, for routes running on the event loop with an
+`AsyncSessionDep`. Password hashing is CPU bound, so it runs in the hashing
+process pool.
+"""
+
+import uuid
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import (
+    ColumnElement,
+    Uuid,
+    any_,
+    bindparam,
+    delete,
+    insert,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import SQLModel, col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import revocation
+from app.core.config import CountStrategy, settings
+from app.core.events import (
+    bulk_created_events,
+    item_event,
+    publish_item_events_async,
+)
+from app.core.metrics import ITEM_OPERATIONS
+from app.core.security import (
+    create_access_token,
+    create_refresh_token,
+    get_password_hash_async,
+    hash_refresh_token,
+    verify_and_update_password_async,
+)
+from app.crud import (
+    attach_cached_user,
+    cached_user_data,
+    count_cache,
+    reltuples_statement,
+    user_cache,
+)
+from app.models import (
+    PERMISSIONS,
+    Item,
+    ItemCreate,
+    ItemTake,
+    RefreshToken,
+    RevokedToken,
+    Room,
+    RoomCreate,
+    Token,
+    TokenPayload,
+    User,
+    UserCreate,
+    UserUpdate,
+)
+
+
+async def count_rows(
+    *,
+    session: AsyncSession,
+    model: type[SQLModel],
+    strategy: CountStrategy,
+    filters: Sequence[ColumnElement[bool]] = (),
+) -> int:
+    table_name = model.__tablename__
+    if filters:
+        strategy = "exact"
+    if strategy == "estimated":
+        result = await session.exec(  # type: ignore[call-overload]
+            reltuples_statement, params={"table_name": f'"{table_name}"'}
+        )
+        estimate = result.scalar_one()
+        if estimate >= settings.COUNT_ESTIMATE_MIN_ROWS:
+            return int(estimate)
+        strategy = "cached"
+    if strategy == "cached":
+        count: int | None = await count_cache.aget(table_name)
+        if count is not None:
+            return count
+    statement = select(func.count()).select_from(model).where(*filters)
+    count = (await session.exec(statement)).one()
+    if strategy == "cached":
+        await count_cache.aset(table_name, count)
+    return count
+
+
+async def invalidate_count(model: type[SQLModel]) -> None:
+    await count_cache.adelete(model.__tablename__)
+
+
+async def invalidate_user(user_id: uuid.UUID | str) -> None:
+    await user_cache.adelete(str(user_id))
+
+
+async def get_user(*, session: AsyncSession, user_id: uuid.UUID | str) -> User | None:
+    data = await user_cache.aget(str(user_id))
+    if data is not None:
+        return attach_cached_user(session=session.sync_session, data=data)
+    user = await session.get(User, user_id)
+    if user is not None:
+        await user_cache.aset(str(user_id), cached_user_data(user))
+    return user
+
+
+async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User:
+    hashed_password = await get_password_hash_async(user_create.password)
+    db_obj = User.model_validate(
+        user_create, update={"hashed_password": hashed_password}
+    )
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
+    await invalidate_count(User)
+    return db_obj
+
+
+async def update_user(
+    *, session: AsyncSession, db_user: User, user_in: UserUpdate
+) -> Any:
+    user_data = user_in.model_dump(exclude_unset=True)
+    extra_data = {}
+    if "password" in user_data:
+        extra_data["hashed_password"] = await get_password_hash_async(
+            user_data["password"]
+        )
+    db_user.sqlmodel_update(user_data, update=extra_data)
+    session.add(db_user)
+    if "password" in user_data or user_data.get("is_active") is False:
+        await end_user_sessions(session=session, user_id=db_user.user_id)
+    await session.commit()
+    await invalidate_user(db_user.user_id)
+    await session.refresh(db_user)
+    return db_user
+
+
+async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
+    statement = select(User).where(User.email == email)
+    return (await session.exec(statement)).first()
+
+
+async def authenticate(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email(session=session, email=email)
+    if not db_user:
+        return None
+    verified, new_hash = await verify_and_update_password_async(
+        password, db_user.hashed_password
+    )
+    if not verified:
+        return None
+    if new_hash:
+        # Stored hash is out of policy, upgrade it while we have the password
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        await session.commit()
+        await invalidate_user(db_user.user_id)
+        await session.refresh(db_user)
+    return db_user
+
+
+async def issue_tokens(
+    *, session: AsyncSession, user: User, family_id: uuid.UUID | None = None
+) -> Token:
+    """
+    Access token with `user`'s permissions as claims, and the next refresh
+    token of the login session `family_id`, or of a new one.
+    """
+    family_id = family_id or uuid.uuid4()
+    refresh_token, token_hash = create_refresh_token()
+    now = datetime.utcnow()
+    session.add(
+        RefreshToken(
+            token_hash=token_hash,
+            family_id=family_id,
+            user_id=user.user_id,
+            expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+    await session.exec(
+        delete(RefreshToken).where(  # type: ignore[call-overload]
+            col(RefreshToken.user_id) == user.user_id,
+            col(RefreshToken.expires_at) <= now,
+        )
+    )
+    await session.commit()
+    access_token = create_access_token(
+        user.user_id,
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        permissions=[name for name in PERMISSIONS if getattr(user, name)],
+        session_id=str(family_id),
+    )
+    return Token(access_token=access_token, refresh_token=refresh_token)
+
+
+async def end_session(*, session: AsyncSession, family_id: uuid.UUID) -> None:
+    await session.exec(
+        delete(RefreshToken).where(col(RefreshToken.family_id) == family_id)  # type: ignore[call-overload]
+    )
+
+
+async def end_user_sessions(*, session: AsyncSession, user_id: uuid.UUID) -> None:
+    """
+    End every login session of a user, in the caller's transaction, when their
+    password changes or they are deactivated. Access tokens already issued
+    last until they expire.
+    """
+    await session.exec(
+        delete(RefreshToken).where(col(RefreshToken.user_id) == user_id)  # type: ignore[call-overload]
+    )
+
+
+async def rotate_refresh_token(
+    *, session: AsyncSession, refresh_token: str
+) -> Token | None:
+    """
+    Trade a refresh token for new tokens, re-reading the user so changes to
+    their permissions or status apply. Returns None if the refresh token is
+    invalid, expired or was already used; reuse ends the login session, as
+    either the client or someone who stole the token has a newer one.
+    """
+    statement = (
+        select(RefreshToken)
+        .where(RefreshToken.token_hash == hash_refresh_token(refresh_token))
+        .with_for_update()
+    )
+    stored = (await session.exec(statement)).first()
+    now = datetime.utcnow()
+    if stored is None or stored.expires_at <= now:
+        return None
+    # Not the user cache: this is where permission changes are picked up
+    user = await session.get(User, stored.user_id, populate_existing=True)
+    if stored.used_at is not None or user is None or not user.is_active:
+        await end_session(session=session, family_id=stored.family_id)
+        await session.commit()
+        return None
+    stored.used_at = now
+    session.add(stored)
+    return await issue_tokens(session=session, user=user, family_id=stored.family_id)
+
+
+async def revoke_token(*, session: AsyncSession, token_data: TokenPayload) -> None:
+    """
+    Revoke a token until it expires, on this worker right away and on the
+    others once they get the NOTIFY sent on commit, and end its login session.
+    """
+    assert token_data.jti is not None and token_data.exp is not None
+    if token_data.sid is not None:
+        await end_session(session=session, family_id=uuid.UUID(token_data.sid))
+    expires_at = datetime.utcfromtimestamp(token_data.exp)
+    await session.exec(
+        pg_insert(RevokedToken)  # type: ignore[call-overload]
+        .values(token_id=token_data.jti, expires_at=expires_at)
+        .on_conflict_do_nothing()
+    )
+    # Revocations of expired tokens are no longer needed
+    await session.exec(
+        delete(RevokedToken).where(col(RevokedToken.expires_at) <= datetime.utcnow())  # type: ignore[call-overload]
+    )
+    await session.exec(  # type: ignore[call-overload]
+        text("SELECT pg_notify(:channel, :payload)"),
+        params={
+            "channel": revocation.CHANNEL,
+            "payload": revocation.notify_payload(token_data.jti, token_data.exp),
+        },
+    )
+    await session.commit()
+    revocation.revocations.add(token_data.jti, token_data.exp)
+
+
+async def create_item(*, session: AsyncSession, item_in: ItemCreate) -> Item:
+    db_item = Item.model_validate(item_in, update={"current_owner_id": None})
+    session.add(db_item)
+    await publish_item_events_async(session, [item_event("created", db_item)])
+    await session.commit()
+    await session.refresh(db_item)
+    await invalidate_count(Item)
+    return db_item
+
+
+async def insert_items(
+    *, session: AsyncSession, items_in: Sequence[ItemCreate]
+) -> None:
+    """
+    Insert items with multi-row INSERTs, without committing, so a bulk import
+    can run many batches in one transaction.
+    """
+    items = [
+        Item.model_validate(item_in, update={"current_owner_id": None})
+        for item_in in items_in
+    ]
+    rows = [item.model_dump() for item in items]
+    await session.exec(insert(Item), params=rows)  # type: ignore[call-overload]
+    await publish_item_events_async(session, bulk_created_events(items))
+
+
+def _take_values(*, user_id: uuid.UUID, item_take: ItemTake) -> dict[str, Any]:
+    values = item_take.model_dump(
+        exclude_unset=True, exclude={"current_owner_id", "taken_at", "is_available"}
+    )
+    return {
+        **values,
+        "current_owner_id": item_take.current_owner_id or user_id,
+        "taken_at": item_take.taken_at or datetime.utcnow(),
+        "is_available": False,
+    }
+
+
+def _item_id_in(item_ids: Sequence[uuid.UUID]) -> ColumnElement[bool]:
+    # One array parameter instead of an IN list, so the statement stays the same
+    # whatever the number of ids
+    return col(Item.item_id) == any_(
+        bindparam("item_ids", item_ids, type_=ARRAY(Uuid()))
+    )
+
+
+def _count_batch(operation: str, *, requested: int, done: int) -> None:
+    ITEM_OPERATIONS.labels(operation, "ok").inc(done)
+    ITEM_OPERATIONS.labels(operation, "rejected").inc(requested - done)
+
+
+async def take_item(
+    *,
+    session: AsyncSession,
+    item_id: uuid.UUID,
+    user_id: uuid.UUID,
+    item_take: ItemTake,
+) -> Item | None:
+    """
+    Take an item if it is still available, in a single conditional UPDATE, so
+    of concurrent takers exactly one wins. Returns None when the item doesn't
+    exist or is already taken.
+    """
+    statement = (
+        update(Item)
+        .where(col(Item.item_id) == item_id, col(Item.is_available))
+        .values(_take_values(user_id=user_id, item_take=item_take))
+        .returning(Item)
+    )
+    item: Item | None = (await session.exec(statement)).scalar_one_or_none()  # type: ignore[call-overload]
+    if item:
+        await publish_item_events_async(
+            session, [item_event("taken", item, user_id=item.current_owner_id)]
+        )
+    await session.commit()
+    ITEM_OPERATIONS.labels("take", "ok" if item else "rejected").inc()
+    return item
+
+
+async def release_item(
+    *, session: AsyncSession, item_id: uuid.UUID, user_id: uuid.UUID
+) -> Item | None:
+    """
+    Release an item held by `user_id` in a single conditional UPDATE. Returns
+    None when the item doesn't exist or isn't held by that user.
+    """
+    statement = (
+        update(Item)
+        .where(col(Item.item_id) == item_id, col(Item.current_owner_id) == user_id)
+        .values(current_owner_id=None, taken_at=None, is_available=True)
+        .returning(Item)
+    )
+    item: Item | None = (await session.exec(statement)).scalar_one_or_none()  # type: ignore[call-overload]
+    if item:
+        await publish_item_events_async(
+            session, [item_event("released", item, user_id=user_id)]
+        )
+    await session.commit()
+    ITEM_OPERATIONS.labels("release", "ok" if item else "rejected").inc()
+    return item
+
+
+async def take_items(
+    *,
+    session: AsyncSession,
+    item_ids: Sequence[uuid.UUID],
+    user_id: uuid.UUID,
+    item_take: ItemTake,
+    atomic: bool,
+) -> list[Item]:
+    """
+    Take every available item of `item_ids` in one UPDATE and one commit.
+
+    When `atomic` and any item can't be taken, nothing is taken.
+    """
+    statement = (
+        update(Item)
+        .where(_item_id_in(item_ids), col(Item.is_available))
+        .values(_take_values(user_id=user_id, item_take=item_take))
+        .returning(Item)
+    )
+    items = list((await session.exec(statement)).scalars())  # type: ignore[call-overload]
+    if atomic and len(items) < len(set(item_ids)):
+        await session.rollback()
+        _count_batch("take", requested=len(set(item_ids)), done=0)
+        return []
+    await publish_item_events_async(
+        session,
+        [item_event("taken", item, user_id=item.current_owner_id) for item in items],
+    )
+    await session.commit()
+    _count_batch("take", requested=len(set(item_ids)), done=len(items))
+    return items
+
+
+async def release_items(
+    *,
+    session: AsyncSession,
+    item_ids: Sequence[uuid.UUID],
+    user_id: uuid.UUID,
+    atomic: bool,
+) -> list[Item]:
+    """
+    Release every item of `item_ids` held by `user_id` in one UPDATE and one
+    commit. When `atomic` and any item can't be released, nothing is released.
+    """
+    statement = (
+        update(Item)
+        .where(_item_id_in(item_ids), col(Item.current_owner_id) == user_id)
+        .values(current_owner_id=None, taken_at=None, is_available=True)
+        .returning(Item)
+    )
+    items = list((await session.exec(statement)).scalars())  # type: ignore[call-overload]
+    if atomic and len(items) < len(set(item_ids)):
+        await session.rollback()
+        _count_batch("release", requested=len(set(item_ids)), done=0)
+        return []
+    await publish_item_events_async(
+        session, [item_event("released", item, user_id=user_id) for item in items]
+    )
+    await session.commit()
+    _count_batch("release", requested=len(set(item_ids)), done=len(items))
+    return items
+
+
+async def create_room(*, session: AsyncSession, room_in: RoomCreate) -> Room:
+    db_room = Room.model_validate(room_in)
+    session.add(db_room)
+    await session.commit()
+    await session.refresh(db_room)
+    await invalidate_count(Room)
+    return db_room
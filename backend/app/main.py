@@ -1,10 +1,19 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.core import events, metrics, outbox, security
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.queries import QueryStatsMiddleware
+from app.core.revocation import revocations
+from app.utils import warm_email_templates
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,12 +23,42 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    warm_email_templates()
+    await revocations.start()
+    if settings.emails_enabled and settings.EMAIL_DISPATCHER_ENABLED:
+        outbox.dispatcher.start()
+    yield
+    await outbox.dispatcher.close()
+    await revocations.close()
+    metrics.mark_worker_dead()
+    await events.broker.close()
+    security.shutdown_hashing_executor()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    # Encodes responses with orjson, much faster than the standard json module
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
+
+@app.exception_handler(security.HashingOverloadedError)
+async def hashing_overloaded_handler(
+    _request: Request, _exc: security.HashingOverloadedError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many password operations, please retry shortly"},
+        headers={"Retry-After": str(settings.PASSWORD_HASHING_RETRY_AFTER_SECONDS)},
+    )
+
+
 # Set all CORS enabled origins
 if settings.all_cors_origins:
     app.add_middleware(
@@ -30,4 +69,19 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        encodings=settings.COMPRESSION_ENCODINGS,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    )
+
+if settings.METRICS_ENABLED:
+    # Timings include the other middlewares
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_route("/metrics", metrics.metrics, include_in_schema=False)
+
+# Wraps the metrics middleware, which reads the queries it tracks
+app.add_middleware(QueryStatsMiddleware)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
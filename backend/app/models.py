@@ -1,8 +1,11 @@
 import uuid
 
 from datetime import datetime
+from typing import Literal
 
 from pydantic import EmailStr
+from sqlalchemy import Column, Computed, Index, Text, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -49,6 +52,10 @@ class UpdatePassword(SQLModel):
 class User(UserBase, table=True):
     user_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
+    # Row version for ETags, bumped by every ORM or Core UPDATE
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow}
+    )
 
 
 # Properties to return via API, id is always required
@@ -58,7 +65,8 @@ class UserPublic(UserBase):
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None = None
+    next_cursor: str | None = None
 
 class UserPermissionsUpdate(SQLModel):
     is_part_of_lab: bool | None = Field(default=None)
@@ -71,10 +79,12 @@ class UserPermissionsUpdate(SQLModel):
 # Shared properties
 class ItemBase(SQLModel):
     item_name: str = Field(min_length=1, max_length=255)
-    current_room: str | None = Field(default=None, max_length=255)
-    table_name: str | None = Field(default=None, max_length=255)
-    system_name: str | None = Field(default=None, max_length=255)
-    current_owner_id: uuid.UUID | None = Field(default=None, foreign_key="user.user_id")
+    current_room: str | None = Field(default=None, max_length=255, index=True)
+    table_name: str | None = Field(default=None, max_length=255, index=True)
+    system_name: str | None = Field(default=None, max_length=255, index=True)
+    current_owner_id: uuid.UUID | None = Field(
+        default=None, foreign_key="user.user_id", index=True
+    )
     taken_at: datetime | None = Field(default=None)
     item_img_url: str | None = Field(default=None, max_length=255)
     item_vendor: str | None = Field(default=None, max_length=255)
@@ -105,9 +115,74 @@ class ItemTake(SQLModel):
     is_available: bool = Field(default=True)
 
 
+# Query parameters filtering GET /items/, unset filters are ignored
+class ItemFilters(SQLModel):
+    current_owner_id: uuid.UUID | None = None
+    current_room: str | None = None
+    table_name: str | None = None
+    system_name: str | None = None
+    is_available: bool | None = None
+
+
+# Properties to receive when taking several items at once
+class ItemsTakeBatch(ItemTake):
+    item_ids: list[uuid.UUID] = Field(min_length=1, max_length=1000)
+    # All items are taken or none are, otherwise every available item is taken
+    atomic: bool = True
+
+
+class ItemsReleaseBatch(SQLModel):
+    item_ids: list[uuid.UUID] = Field(min_length=1, max_length=1000)
+    atomic: bool = True
+
+
+# Document searched by GET /items/search, stored in the generated
+# `search_vector` column so ranking doesn't re-parse the text of every match
+ITEM_SEARCH_DOCUMENT = (
+    "to_tsvector('english'::regconfig, coalesce(item_name, '') || ' ' || "
+    "coalesce(item_vendor, '') || ' ' || coalesce(item_params, ''))"
+)
+
+
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    __table_args__ = (
+        # Only used in SQL, so it's left out of the model and never loaded
+        Column(
+            "search_vector",
+            TSVECTOR,
+            Computed(ITEM_SEARCH_DOCUMENT, persisted=True),
+        ),
+        Index("ix_item_item_name_item_id", "item_name", "item_id"),
+        Index("ix_item_search_vector", "search_vector", postgresql_using="gin"),
+        # Typo tolerant matching of names, needs the pg_trgm extension
+        Index(
+            "ix_item_item_name_trgm",
+            "item_name",
+            postgresql_using="gin",
+            postgresql_ops={"item_name": "gin_trgm_ops"},
+        ),
+        # Partial indexes in the listing's sort order, so paging through
+        # available or taken items only reads matching rows
+        Index(
+            "ix_item_available_item_name_item_id",
+            "item_name",
+            "item_id",
+            postgresql_where=text("is_available"),
+        ),
+        Index(
+            "ix_item_taken_item_name_item_id",
+            "item_name",
+            "item_id",
+            postgresql_where=text("NOT is_available"),
+        ),
+    )
+    __mapper_args__ = {"exclude_properties": ["search_vector"]}
+
     item_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow}
+    )
 
 
 # Properties to return via API, id is always required
@@ -117,7 +192,51 @@ class ItemPublic(ItemBase):
 
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    count: int | None = None
+    next_cursor: str | None = None
+
+
+# Outcome for one item of a batch take or release
+class ItemBatchResult(SQLModel):
+    item_id: uuid.UUID
+    success: bool
+    detail: str | None = None
+    item: ItemPublic | None = None
+
+
+class ItemsBatchResult(SQLModel):
+    data: list[ItemBatchResult]
+    succeeded: int
+    failed: int
+
+
+# A row of a bulk import that was not imported
+class ItemBulkError(SQLModel):
+    line: int
+    detail: str
+
+
+class ItemsBulkResult(SQLModel):
+    created: int
+    failed: int
+    # Only the first ITEMS_BULK_MAX_ERRORS failures are listed
+    errors: list[ItemBulkError]
+
+
+ItemEventKind = Literal["created", "bulk_created", "taken", "released", "deleted"]
+
+
+# Pushed by GET /items/events when an item is created, taken, released or
+# deleted. `user_id` is who took or released it. A bulk import sends one
+# `bulk_created` event per batch and room instead, with the `count` of items
+# created and no `item_id`.
+class ItemEvent(SQLModel):
+    event: ItemEventKind
+    item_id: uuid.UUID | None = None
+    current_room: str | None = None
+    user_id: uuid.UUID | None = None
+    is_available: bool | None = None
+    count: int | None = None
 
 class RoomBase(SQLModel):
     room_number: str = Field(max_length=255)
@@ -139,7 +258,12 @@ class RoomUpdate(SQLModel):
 
 # Database model, database table inferred from class name
 class Room(RoomBase, table=True):
+    __table_args__ = (Index("ix_room_room_number_room_id", "room_number", "room_id"),)
+
     room_id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow}
+    )
 
 
 # Properties to return via API, id is always required
@@ -149,7 +273,8 @@ class RoomPublic(RoomBase):
 
 class RoomsPublic(SQLModel):
     data: list[RoomPublic]
-    count: int
+    count: int | None = None
+    next_cursor: str | None = None
 
 
 # Generic message
@@ -157,15 +282,97 @@ class Message(SQLModel):
     message: str
 
 
+# Connection pool usage of one engine in the current worker process
+class DatabasePoolStats(SQLModel):
+    engine: str
+    size: int
+    checked_out: int
+    overflow: int
+    max_overflow: int
+    checkout_count: int
+    checkout_wait_seconds: float
+
+
 # JSON payload containing access token
 class Token(SQLModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: str | None = None
+
+
+class TokenRefresh(SQLModel):
+    refresh_token: str
+
+
+# User flags granted as claims of access tokens
+PERMISSIONS = (
+    "is_superuser",
+    "is_part_of_lab",
+    "can_edit_items",
+    "can_edit_labs",
+    "can_edit_users",
+)
 
 
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: str | None = None
+    exp: int | None = None
+    jti: str | None = None
+    # Login session, the refresh token family the token was issued from
+    sid: str | None = None
+    # Granted PERMISSIONS, None in tokens issued before they were claims
+    perms: list[str] | None = None
+
+
+# Who makes a request and what they may do, from the access token alone
+class Principal(SQLModel):
+    user_id: uuid.UUID
+    is_superuser: bool = False
+    is_part_of_lab: bool = False
+    can_edit_items: bool = False
+    can_edit_labs: bool = False
+    can_edit_users: bool = False
+
+
+# Emails waiting to be sent by the outbox dispatcher, deleted once sent.
+# Emails given up on are kept with status "dead" and their last error.
+class OutboxEmail(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_outboxemail_pending_next_attempt_at",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str = Field(max_length=1000)
+    html_content: str = Field(sa_type=Text)
+    status: str = Field(default="pending", max_length=16)
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    last_error: str | None = Field(default=None, sa_type=Text)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Refresh tokens, stored hashed. Each one can be used once, for a new access
+# token and the next refresh token of its family, which is one login session.
+class RefreshToken(SQLModel, table=True):
+    token_hash: str = Field(primary_key=True, max_length=64)
+    family_id: uuid.UUID = Field(index=True)
+    user_id: uuid.UUID = Field(
+        foreign_key="user.user_id", ondelete="CASCADE", index=True
+    )
+    expires_at: datetime
+    used_at: datetime | None = None
+
+
+# Access tokens revoked before they expire, kept until then
+class RevokedToken(SQLModel, table=True):
+    token_id: str = Field(primary_key=True, max_length=64)
+    expires_at: datetime
 
 
 class NewPassword(SQLModel):
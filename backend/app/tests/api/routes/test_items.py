@@ -1,10 +1,20 @@
+import csv
+import gzip
+import io
+import json
 import uuid
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, select, text
 
+from app import crud
+from app.api.serialization import item_serializer
 from app.core.config import settings
+from app.models import Item, ItemCreate, ItemPublic
+from app.tests.conftest import QueryBudget
 from app.tests.utils.item import create_random_item
+from app.tests.utils.utils import random_lower_string
 
 
 def test_create_item(
@@ -79,6 +89,33 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_compressed(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(10):
+        create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers={**lab_user_token_headers, "Accept-Encoding": "br;q=0.5, gzip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert len(response.json()["data"]) >= 10
+
+
+def test_read_item_not_compressed_when_small(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item.item_id}",
+        headers={**lab_user_token_headers, "Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -162,3 +199,615 @@ def test_delete_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+def test_read_items_cursor_pagination(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(5):
+        create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=lab_user_token_headers,
+        params={"limit": 1000},
+    )
+    assert response.status_code == 200
+    expected = [item["item_id"] for item in response.json()["data"]]
+
+    seen: list[str] = []
+    params: dict[str, str | int] = {"limit": 2}
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=lab_user_token_headers,
+            params=params,
+        )
+        assert response.status_code == 200
+        content = response.json()
+        seen.extend(item["item_id"] for item in content["data"])
+        if content["next_cursor"] is None:
+            break
+        params = {"limit": 2, "cursor": content["next_cursor"]}
+    assert seen == expected
+
+
+def test_read_items_invalid_cursor(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=lab_user_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_items_without_count(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=lab_user_token_headers,
+        params={"include_count": False},
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] is None
+
+
+def test_read_items_cached_count_invalidated_on_create(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=lab_user_token_headers
+    )
+    count = response.json()["count"]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=lab_user_token_headers,
+        json={"item_name": "Oscilloscope"},
+    )
+    assert response.status_code == 200
+    response = client.get(
+        f"{settings.API_V1_STR}/items/", headers=lab_user_token_headers
+    )
+    assert response.json()["count"] == count + 1
+
+
+def test_create_items_bulk_csv(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    body = (
+        "item_name,item_vendor,item_params\n"
+        'Scope,Rigol,"100 MHz, 4 channels"\n'
+        ",Keysight,\n"
+        'Multimeter,Fluke,"True RMS\n6000 counts"\n'
+        "Probe,Rigol\n"
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers={**lab_user_token_headers, "Content-Type": "text/csv"},
+        content=body.encode(),
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["created"] == 2
+    assert content["failed"] == 2
+    assert [error["line"] for error in content["errors"]] == [3, 6]
+    assert "item_name" in content["errors"][0]["detail"]
+    item = db.exec(
+        select(Item).where(Item.item_params == "True RMS\n6000 counts")
+    ).one()
+    assert item.item_name == "Multimeter"
+    assert item.is_available
+
+
+def test_create_items_bulk_jsonl(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    lines = [
+        json.dumps({"item_name": f"Resistor {i}", "item_vendor": "Vishay"})
+        for i in range(5)
+    ]
+    lines.insert(2, "{not json")
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers={**lab_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content="\n".join(lines).encode(),
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["created"] == 5
+    assert content["errors"] == [{"line": 3, "detail": "Malformed row"}]
+
+
+def test_create_items_bulk_csv_unclosed_quote(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers={**lab_user_token_headers, "Content-Type": "text/csv"},
+        content=b'item_name\n"Scope\nProbe\nMultimeter\n',
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["created"] == 2
+    assert content["errors"] == [{"line": 2, "detail": "Malformed row"}]
+
+
+def test_create_items_bulk_bad_lines(
+    client: TestClient,
+    lab_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "ITEMS_BULK_MAX_LINE_BYTES", 100)
+    body = b"item_name\nScope\n\xff\xfe bad\n" + b"x" * 500 + b"\nProbe\n"
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers={**lab_user_token_headers, "Content-Type": "text/csv"},
+        content=body,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["created"] == 2
+    assert [error["line"] for error in content["errors"]] == [3, 4]
+
+
+def test_create_items_bulk_unsupported_content_type(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/bulk",
+        headers=lab_user_token_headers,
+        json=[{"item_name": "Scope"}],
+    )
+    assert response.status_code == 415
+
+
+def test_export_items_csv_gzip(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=lab_user_token_headers,
+        params={"format": "csv", "gzip": True},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="items.csv.gz"' in response.headers["content-disposition"]
+    # Already gzipped, not compressed again
+    assert "content-encoding" not in response.headers
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert str(item.item_id) in {row["item_id"] for row in rows}
+    assert "count" not in rows[0]
+
+
+def test_export_items_jsonl(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=lab_user_token_headers,
+        params={"format": "jsonl"},
+    )
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    exported = next(row for row in rows if row["item_id"] == str(item.item_id))
+    assert exported["item_name"] == item.item_name
+
+
+def test_export_items_jsonl_compressed(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers={**lab_user_token_headers, "Accept-Encoding": "gzip"},
+        params={"format": "jsonl"},
+    )
+    assert response.status_code == 200
+    # Streamed, so compressed chunk by chunk without a known length
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert str(item.item_id) in {row["item_id"] for row in rows}
+
+
+def test_export_items_parquet(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    pq = pytest.importorskip("pyarrow.parquet")
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=lab_user_token_headers,
+        params={"format": "parquet"},
+    )
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert str(item.item_id) in table.column("item_id").to_pylist()
+
+
+def test_export_items_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 403
+
+
+def test_take_item_conflict(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.item_id}/take"
+    response = client.put(url, headers=lab_user_token_headers, json={})
+    assert response.status_code == 200
+    assert response.json()["is_available"] is False
+    response = client.put(url, headers=lab_user_token_headers, json={})
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Item is already taken"
+
+    response = client.put(
+        f"{settings.API_V1_STR}/items/{item.item_id}/release",
+        headers=lab_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["is_available"] is True
+
+
+def test_take_item_not_found(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    response = client.put(
+        f"{settings.API_V1_STR}/items/{uuid.uuid4()}/take",
+        headers=lab_user_token_headers,
+        json={},
+    )
+    assert response.status_code == 404
+
+
+def test_take_items_batch_atomic(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    items = [create_random_item(db) for _ in range(3)]
+    taken = items[0]
+    response = client.put(
+        f"{settings.API_V1_STR}/items/{taken.item_id}/take",
+        headers=lab_user_token_headers,
+        json={},
+    )
+    assert response.status_code == 200
+
+    item_ids = [str(item.item_id) for item in items] + [str(uuid.uuid4())]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/take-batch",
+        headers=lab_user_token_headers,
+        json={"item_ids": item_ids, "current_room": "B12"},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["succeeded"] == 0
+    assert [result["detail"] for result in content["data"]] == [
+        "Item is already taken",
+        "Not taken, another item of the batch can't be taken",
+        "Not taken, another item of the batch can't be taken",
+        "Item not found",
+    ]
+    db.refresh(items[1])
+    assert items[1].is_available
+
+
+def test_take_and_release_items_batch_best_effort(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    items = [create_random_item(db) for _ in range(3)]
+    item_ids = [str(item.item_id) for item in items]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/take-batch",
+        headers=lab_user_token_headers,
+        json={"item_ids": item_ids[:2], "current_room": "B12"},
+    )
+    assert response.json()["succeeded"] == 2
+    assert response.json()["data"][0]["item"]["current_room"] == "B12"
+
+    response = client.post(
+        f"{settings.API_V1_STR}/items/release-batch",
+        headers=lab_user_token_headers,
+        json={"item_ids": item_ids, "atomic": False},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["succeeded"] == 2
+    assert content["failed"] == 1
+    assert content["data"][2] == {
+        "item_id": item_ids[2],
+        "success": False,
+        "detail": "Item is not taken",
+        "item": None,
+    }
+    for item in items[:2]:
+        db.refresh(item)
+        assert item.is_available
+
+
+def test_read_items_filtered(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    items = [create_random_item(db) for _ in range(3)]
+    room = f"room-{uuid.uuid4()}"
+    for item in items[:2]:
+        item.current_room = room
+        db.add(item)
+    items[0].is_available = False
+    db.commit()
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=lab_user_token_headers,
+        params={"current_room": room},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] == 2
+    assert {item["item_id"] for item in content["data"]} == {
+        str(item.item_id) for item in items[:2]
+    }
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=lab_user_token_headers,
+        params={"current_room": room, "is_available": True},
+    )
+    content = response.json()
+    assert content["count"] == 1
+    assert content["data"][0]["item_id"] == str(items[1].item_id)
+
+
+def test_read_items_fields(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    room = f"room-{uuid.uuid4()}"
+    for _ in range(3):
+        item = create_random_item(db)
+        item.current_room = room
+        db.add(item)
+    db.commit()
+    url = f"{settings.API_V1_STR}/items/"
+    params: dict[str, str | int] = {
+        "current_room": room,
+        "fields": "is_available, item_id",
+        "limit": 2,
+    }
+
+    response = client.get(url, headers=lab_user_token_headers, params=params)
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] == 3
+    assert [set(item) for item in content["data"]] == [{"item_id", "is_available"}] * 2
+    full = client.get(
+        url, headers=lab_user_token_headers, params={"current_room": room}
+    )
+    # Another representation of the same page, so another ETag
+    assert full.headers["ETag"] != response.headers["ETag"]
+
+    response = client.get(
+        url,
+        headers=lab_user_token_headers,
+        params={**params, "cursor": content["next_cursor"]},
+    )
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 1
+
+    response = client.get(
+        url, headers=lab_user_token_headers, params={"fields": "item_id,search_vector"}
+    )
+    assert response.status_code == 422
+
+
+def test_read_item_not_modified(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.item_id}"
+    response = client.get(url, headers=lab_user_token_headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag.startswith('"')
+
+    response = client.get(
+        url, headers={**lab_user_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    response = client.put(
+        url, headers=lab_user_token_headers, json={"item_name": "Renamed"}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    response = client.get(
+        url, headers={**lab_user_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["item_name"] == "Renamed"
+
+
+def test_read_items_not_modified(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    room = f"room-{uuid.uuid4()}"
+    item.current_room = room
+    db.add(item)
+    db.commit()
+    url = f"{settings.API_V1_STR}/items/"
+    response = client.get(
+        url, headers=lab_user_token_headers, params={"current_room": room}
+    )
+    etag = response.headers["ETag"]
+
+    headers = {**lab_user_token_headers, "If-None-Match": etag}
+    response = client.get(url, headers=headers, params={"current_room": room})
+    assert response.status_code == 304
+
+    item.item_vendor = "Changed"
+    db.add(item)
+    db.commit()
+    response = client.get(url, headers=headers, params={"current_room": room})
+    assert response.status_code == 200
+
+
+def test_update_item_if_match(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.item_id}"
+    etag = client.get(url, headers=lab_user_token_headers).headers["ETag"]
+
+    response = client.put(
+        url,
+        headers={**lab_user_token_headers, "If-Match": etag},
+        json={"item_name": "First"},
+    )
+    assert response.status_code == 200
+
+    # A second writer still holding the old version must not overwrite
+    response = client.put(
+        url,
+        headers={**lab_user_token_headers, "If-Match": etag},
+        json={"item_name": "Second"},
+    )
+    assert response.status_code == 412
+    db.refresh(item)
+    assert item.item_name == "First"
+
+
+def test_update_item_if_match_weak(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.item_id}"
+    etag = client.get(url, headers=lab_user_token_headers).headers["ETag"]
+
+    # If-Match uses the strong comparison, a weak tag never matches
+    response = client.put(
+        url,
+        headers={**lab_user_token_headers, "If-Match": f"W/{etag}"},
+        json={"item_name": "Weak"},
+    )
+    assert response.status_code == 412
+    db.refresh(item)
+    assert item.item_name != "Weak"
+
+
+def test_item_events_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/events", headers=normal_user_token_headers
+    )
+    assert response.status_code == 403
+
+
+def test_item_serializer_matches_response_model(db: Session) -> None:
+    item = create_random_item(db)
+    # Expired attributes aren't in the instance dict and load through the ORM
+    db.expire(item)
+    content = json.loads(item_serializer.response(item).body)
+    assert content == ItemPublic.model_validate(item).model_dump(mode="json")
+    assert json.loads(item_serializer.response(item).body) == content
+
+
+@pytest.fixture
+def pg_trgm(db: Session) -> None:
+    installed = db.exec(
+        text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")  # type: ignore[call-overload]
+    ).scalar_one()
+    if not installed:
+        pytest.skip("needs the pg_trgm extension")
+
+
+@pytest.mark.usefixtures("pg_trgm")
+def test_search_items(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    tag = random_lower_string()[:10]
+    names = [f"oscilloscope {tag}", f"oscilloscope probe {tag}", f"multimeter {tag}"]
+    for name in names:
+        crud.create_item(session=db, item_in=ItemCreate(item_name=name))
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/search",
+        headers=lab_user_token_headers,
+        params={"q": f"oscillo {tag}"},
+    )
+    assert response.status_code == 200
+    found = [item["item_name"] for item in response.json()["data"]]
+    assert set(found) == set(names[:2])
+
+    # Typo in the name
+    response = client.get(
+        f"{settings.API_V1_STR}/items/search",
+        headers=lab_user_token_headers,
+        params={"q": f"multimeterr {tag}"},
+    )
+    assert response.json()["data"][0]["item_name"] == names[2]
+
+
+@pytest.mark.usefixtures("pg_trgm")
+def test_search_items_cursor_pagination(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    tag = random_lower_string()[:10]
+    for i in range(5):
+        crud.create_item(session=db, item_in=ItemCreate(item_name=f"cable {i} {tag}"))
+
+    seen: list[str] = []
+    params: dict[str, str | int] = {"q": tag, "limit": 2}
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/search",
+            headers=lab_user_token_headers,
+            params=params,
+        )
+        assert response.status_code == 200
+        content = response.json()
+        seen.extend(item["item_id"] for item in content["data"])
+        if content["next_cursor"] is None:
+            break
+        params = {"q": tag, "limit": 2, "cursor": content["next_cursor"]}
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_item_routes_query_budget(
+    client: TestClient,
+    lab_user_token_headers: dict[str, str],
+    db: Session,
+    query_budget: QueryBudget,
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items"
+    # The count is one more query, unless cached
+    with query_budget(2):
+        response = client.get(f"{url}/", headers=lab_user_token_headers)
+    assert response.status_code == 200
+    assert response.headers["server-timing"].startswith("db;dur=")
+    with query_budget(1):
+        response = client.get(f"{url}/{item.item_id}", headers=lab_user_token_headers)
+    assert response.status_code == 200
+    # The update, and the NOTIFY of the item event
+    with query_budget(2):
+        response = client.put(
+            f"{url}/{item.item_id}/take", headers=lab_user_token_headers, json={}
+        )
+    assert response.status_code == 200
+    with query_budget(2):
+        response = client.put(
+            f"{url}/{item.item_id}/release", headers=lab_user_token_headers
+        )
+    assert response.status_code == 200
@@ -1,11 +1,17 @@
+import time
+from datetime import timedelta
 from unittest.mock import patch
 
+import jwt
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlmodel import Session, select, text
 
+from app import crud
+from app.core import revocation
 from app.core.config import settings
-from app.core.security import verify_password
-from app.models import User
+from app.core.security import ALGORITHM, create_access_token, verify_password
+from app.models import OutboxEmail, User, UserCreate, UserUpdate
+from app.tests.utils.utils import random_email, random_lower_string
 from app.utils import generate_password_reset_token
 
 
@@ -19,6 +25,7 @@ def test_get_access_token(client: TestClient) -> None:
     assert r.status_code == 200
     assert "access_token" in tokens
     assert tokens["access_token"]
+    assert tokens["refresh_token"]
 
 
 def test_get_access_token_incorrect_password(client: TestClient) -> None:
@@ -30,6 +37,19 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def test_get_access_token_hashing_overloaded(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with patch("app.core.config.settings.PASSWORD_HASHING_MAX_PENDING", 0):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == str(
+        settings.PASSWORD_HASHING_RETRY_AFTER_SECONDS
+    )
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -43,7 +63,7 @@ def test_use_access_token(
 
 
 def test_recovery_password(
-    client: TestClient, normal_user_token_headers: dict[str, str]
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
     with (
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
@@ -56,6 +76,9 @@ def test_recovery_password(
         )
         assert r.status_code == 200
         assert r.json() == {"message": "Password recovery email sent"}
+    # Queued for the outbox dispatcher, not sent by the request
+    queued = db.exec(select(OutboxEmail).where(OutboxEmail.email_to == email)).all()
+    assert queued
 
 
 def test_recovery_password_user_not_exits(
@@ -102,3 +125,178 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+def test_logout(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    tokens = client.post(
+        f"{settings.API_V1_STR}/login/access-token", data=login_data
+    ).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    r = client.post(f"{settings.API_V1_STR}/logout", headers=headers)
+    assert r.status_code == 200
+    assert r.json() == {"message": "Logged out"}
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 401
+
+    # Rejected even though its claims are cached
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 403
+    r = client.post(f"{settings.API_V1_STR}/logout", headers=headers)
+    assert r.status_code == 403
+
+
+def test_token_revoked_by_another_worker(client: TestClient, db: Session) -> None:
+    user = db.exec(select(User).where(User.email == settings.FIRST_SUPERUSER)).one()
+    token = create_access_token(user.user_id, timedelta(minutes=5))
+    headers = {"Authorization": f"Bearer {token}"}
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    # What another worker's logout sends
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    db.exec(
+        text("SELECT pg_notify(:channel, :payload)"),  # type: ignore[call-overload]
+        params={
+            "channel": revocation.CHANNEL,
+            "payload": revocation.notify_payload(payload["jti"], payload["exp"]),
+        },
+    )
+    db.commit()
+    for _ in range(50):
+        r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+        if r.status_code == 403:
+            break
+        time.sleep(0.1)
+    assert r.status_code == 403
+
+
+def test_refresh_token_rotation(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    tokens = client.post(
+        f"{settings.API_V1_STR}/login/access-token", data=login_data
+    ).json()
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 200
+    refreshed = r.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    headers = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    # Reusing a refresh token ends the session, the newest one included
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": tokens["refresh_token"]},
+    )
+    assert r.status_code == 401
+    r = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": refreshed["refresh_token"]},
+    )
+    assert r.status_code == 401
+
+
+def test_refresh_token_picks_up_permission_changes(
+    client: TestClient, db: Session
+) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(
+            email=random_email(), password=password, is_part_of_lab=True
+        ),
+    )
+    tokens = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": user.email, "password": password},
+    ).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    r = client.get(f"{settings.API_V1_STR}/items/export", headers=headers)
+    assert r.status_code == 200
+
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(is_part_of_lab=False))
+    refreshed = client.post(
+        f"{settings.API_V1_STR}/login/refresh-token",
+        json={"refresh_token": tokens["refresh_token"]},
+    ).json()
+    headers = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    r = client.get(f"{settings.API_V1_STR}/items/export", headers=headers)
+    assert r.status_code == 403
+
+
+def test_token_without_subject_rejected(client: TestClient) -> None:
+    token = jwt.encode(
+        {"exp": time.time() + 60}, settings.SECRET_KEY, algorithm=ALGORITHM
+    )
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert r.status_code == 403
+
+
+def test_password_and_status_changes_end_login_sessions(
+    client: TestClient, db: Session
+) -> None:
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=random_email(), password=password)
+    )
+
+    def login() -> dict[str, str]:
+        r = client.post(
+            f"{settings.API_V1_STR}/login/access-token",
+            data={"username": user.email, "password": password},
+        )
+        assert r.status_code == 200
+        tokens: dict[str, str] = r.json()
+        return tokens
+
+    def refreshes(tokens: dict[str, str]) -> bool:
+        r = client.post(
+            f"{settings.API_V1_STR}/login/refresh-token",
+            json={"refresh_token": tokens["refresh_token"]},
+        )
+        return r.status_code == 200
+
+    tokens = login()
+    r = client.post(
+        f"{settings.API_V1_STR}/reset-password/",
+        json={
+            "new_password": password,
+            "token": generate_password_reset_token(email=user.email),
+        },
+    )
+    assert r.status_code == 200
+    assert not refreshes(tokens)
+
+    tokens = login()
+    new_password = random_lower_string()
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/me/password",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        json={"current_password": password, "new_password": new_password},
+    )
+    assert r.status_code == 200
+    assert not refreshes(tokens)
+    password = new_password
+
+    tokens = login()
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(is_active=False))
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(is_active=True))
+    assert not refreshes(tokens)
@@ -0,0 +1,72 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models import Room
+from app.tests.conftest import QueryBudget
+from app.tests.utils.utils import random_lower_string
+
+
+def test_room_routes_query_budget(
+    client: TestClient,
+    lab_user_token_headers: dict[str, str],
+    db: Session,
+    query_budget: QueryBudget,
+) -> None:
+    room = Room(room_number=random_lower_string(), room_place=random_lower_string())
+    db.add(room)
+    db.commit()
+    db.refresh(room)
+    # The count is one more query, unless cached
+    with query_budget(2):
+        r = client.get(f"{settings.API_V1_STR}/rooms/", headers=lab_user_token_headers)
+    assert r.status_code == 200
+    with query_budget(1):
+        r = client.get(
+            f"{settings.API_V1_STR}/rooms/{room.room_id}",
+            headers=lab_user_token_headers,
+        )
+    assert r.status_code == 200
+
+
+def test_read_room_not_modified(
+    client: TestClient,
+    lab_user_token_headers: dict[str, str],
+    db: Session,
+    query_budget: QueryBudget,
+) -> None:
+    room = Room(room_number=random_lower_string(), room_place=random_lower_string())
+    db.add(room)
+    db.commit()
+    db.refresh(room)
+    url = f"{settings.API_V1_STR}/rooms/{room.room_id}"
+    etag = client.get(url, headers=lab_user_token_headers).headers["ETag"]
+
+    headers = {**lab_user_token_headers, "If-None-Match": etag}
+    # Only the room's version is read
+    with query_budget(1):
+        r = client.get(url, headers=headers)
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+
+    room.room_place = random_lower_string()
+    db.add(room)
+    db.commit()
+    r = client.get(url, headers=headers)
+    assert r.status_code == 200
+    assert r.json()["room_place"] == room.room_place
+
+
+def test_read_rooms_empty_page(
+    client: TestClient, lab_user_token_headers: dict[str, str], db: Session
+) -> None:
+    db.add(Room(room_number=random_lower_string(), room_place=random_lower_string()))
+    db.commit()
+    r = client.get(
+        f"{settings.API_V1_STR}/rooms/",
+        headers=lab_user_token_headers,
+        params={"limit": 0},
+    )
+    assert r.status_code == 200
+    assert r.json()["data"] == []
+    assert r.json()["next_cursor"] is None
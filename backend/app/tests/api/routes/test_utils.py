@@ -0,0 +1,50 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_read_db_pool_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-pool/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    stats = {pool["engine"]: pool for pool in r.json()}
+    assert set(stats) == {"sync", "async"}
+    assert stats["sync"]["size"] == settings.POSTGRES_POOL_SIZE
+    assert stats["sync"]["checkout_count"] > 0
+
+
+def test_read_db_pool_stats_normal_user(
+    client: TestClient, lab_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-pool/", headers=lab_user_token_headers
+    )
+    assert r.status_code == 403
+
+
+def test_metrics(client: TestClient, lab_user_token_headers: dict[str, str]) -> None:
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=lab_user_token_headers)
+    assert r.status_code == 200
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert (
+        'http_request_duration_seconds_count{route="items-read_items",status="200"}'
+        in r.text
+    )
+    assert 'http_request_db_queries_count{route="items-read_items"}' in r.text
+    assert "password_hashing_seconds_count" in r.text
+    assert "/metrics" not in client.get("/api/v1/openapi.json").text
+
+
+def test_metrics_token(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    r = client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+    assert r.status_code == 401
+    r = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert r.status_code == 200
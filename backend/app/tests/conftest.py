@@ -1,17 +1,28 @@
-from collections.abc import Generator
+from collections.abc import Callable, Generator, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from typing import Any
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlmodel import Session, delete
 
 from app.core.config import settings
-from app.core.db import engine, init_db
+from app.core.db import async_engine, engine, init_db
 from app.main import app
 from app.models import Item, User
-from app.tests.utils.user import authentication_token_from_email
+from app.tests.utils.user import (
+    authentication_token_from_email,
+    lab_user_authentication_headers,
+)
 from app.tests.utils.utils import get_superuser_token_headers
 
 
+@pytest.fixture(scope="session")
+def anyio_backend() -> str:
+    return "asyncio"
+
+
 @pytest.fixture(scope="session", autouse=True)
 def db() -> Generator[Session, None, None]:
     with Session(engine) as session:
@@ -40,3 +51,41 @@ def normal_user_token_headers(client: TestClient, db: Session) -> dict[str, str]
     return authentication_token_from_email(
         client=client, email=settings.EMAIL_TEST_USER, db=db
     )
+
+
+@pytest.fixture(scope="module")
+def lab_user_token_headers(client: TestClient, db: Session) -> dict[str, str]:
+    return lab_user_authentication_headers(client=client, db=db)
+
+
+QueryBudget = Callable[[int], AbstractContextManager[list[str]]]
+
+
+@pytest.fixture
+def query_budget() -> QueryBudget:
+    """
+    Fail the test if the requests made in `with query_budget(n):` run more
+    than `n` database queries, listing them.
+    """
+
+    @contextmanager
+    def budget(max_queries: int) -> Iterator[list[str]]:
+        statements: list[str] = []
+
+        def record(_conn: Any, _cursor: Any, statement: str, *_args: Any) -> None:
+            statements.append(statement)
+
+        engines = (engine, async_engine.sync_engine)
+        for instrumented in engines:
+            event.listen(instrumented, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            for instrumented in engines:
+                event.remove(instrumented, "before_cursor_execute", record)
+        assert len(statements) <= max_queries, (
+            f"{len(statements)} queries over a budget of {max_queries}:\n"
+            + "\n".join(statements)
+        )
+
+    return budget
@@ -0,0 +1,168 @@
+import asyncio
+import socket
+from collections.abc import Generator
+from datetime import datetime
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, delete, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.outbox import EmailDispatcher, queue_email
+from app.models import OutboxEmail
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+class Inbox:
+    def __init__(self) -> None:
+        self.received: list[tuple[Any, Any]] = []
+
+    async def handle_RCPT(
+        self, _server: Any, _session: Any, envelope: Any, address: str, _options: Any
+    ) -> str:
+        if address.startswith("rejected@"):
+            return "550 No such user here"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, _server: Any, session: Any, envelope: Any) -> str:
+        self.received.append((session.peer, envelope))
+        return "250 Message accepted for delivery"
+
+    def recipients(self) -> list[str]:
+        return [to for _, envelope in self.received for to in envelope.rcpt_tos]
+
+
+@pytest.fixture
+def outbox() -> Generator[Session, None, None]:
+    with Session(engine) as session:
+        session.exec(delete(OutboxEmail))  # type: ignore[call-overload]
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def smtp_server() -> Generator[Inbox, None, None]:
+    inbox = Inbox()
+    port = free_port()
+    server = controller.Controller(inbox, hostname="127.0.0.1", port=port)
+    server.start()
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"),
+        patch("app.core.config.settings.SMTP_PORT", port),
+        patch("app.core.config.settings.SMTP_TLS", False),
+        patch("app.core.config.settings.SMTP_SSL", False),
+        patch("app.core.config.settings.SMTP_USER", None),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "lab@example.com"),
+    ):
+        yield inbox
+    server.stop()
+
+
+def queue(session: Session, *recipients: str) -> None:
+    for email_to in recipients:
+        queue_email(session, email_to=email_to, subject="Hi", html_content="<p>Hi</p>")
+    session.commit()
+
+
+def test_dispatch_batch_over_one_connection(
+    outbox: Session, smtp_server: Inbox
+) -> None:
+    recipients = [f"user{i}@example.com" for i in range(3)]
+    queue(outbox, *recipients)
+    dispatcher = EmailDispatcher()
+    try:
+        assert dispatcher.dispatch_batch() == 3
+    finally:
+        dispatcher.smtp.close()
+
+    assert sorted(smtp_server.recipients()) == recipients
+    assert len({peer for peer, _ in smtp_server.received}) == 1
+    envelope = smtp_server.received[0][1]
+    assert envelope.mail_from == "lab@example.com"
+    assert b"<p>Hi</p>" in envelope.content
+    # Sent emails leave the outbox
+    assert outbox.exec(select(OutboxEmail)).all() == []
+
+
+def test_dispatch_dead_letters_rejected_email(
+    outbox: Session, smtp_server: Inbox
+) -> None:
+    queue(outbox, "rejected@example.com", "accepted@example.com")
+    dispatcher = EmailDispatcher()
+    try:
+        assert dispatcher.dispatch_batch() == 2
+    finally:
+        dispatcher.smtp.close()
+
+    assert smtp_server.recipients() == ["accepted@example.com"]
+    email = outbox.exec(select(OutboxEmail)).one()
+    assert email.email_to == "rejected@example.com"
+    assert email.status == "dead"
+    assert email.attempts == 1
+    assert email.last_error and "550" in email.last_error
+
+
+def test_dispatch_retries_with_backoff(outbox: Session, smtp_server: Inbox) -> None:
+    queue(outbox, "user@example.com", "other@example.com")
+    dispatcher = EmailDispatcher()
+    # Nothing listens there
+    with patch("app.core.config.settings.SMTP_PORT", free_port()):
+        before = datetime.utcnow()
+        assert dispatcher.dispatch_batch() == 2
+        emails = outbox.exec(select(OutboxEmail)).all()
+        assert [email.status for email in emails] == ["pending", "pending"]
+        for email in emails:
+            assert email.attempts == 1
+            assert email.next_attempt_at > before
+            assert email.last_error
+            assert email.last_error.startswith("SMTPUnavailableError")
+        # Not due yet
+        assert dispatcher.dispatch_batch() == 0
+
+        for email in emails:
+            email.attempts = settings.EMAIL_MAX_ATTEMPTS - 1
+            email.next_attempt_at = datetime.utcnow()
+            outbox.add(email)
+        outbox.commit()
+        assert dispatcher.dispatch_batch() == 2
+        for email in outbox.exec(select(OutboxEmail)).all():
+            outbox.refresh(email)
+            assert email.status == "dead"
+            assert email.attempts == settings.EMAIL_MAX_ATTEMPTS
+
+    assert smtp_server.received == []
+
+
+@pytest.mark.anyio
+async def test_dispatcher_sends_after_idle_polls(
+    outbox: Session, smtp_server: Inbox
+) -> None:
+    dispatcher = EmailDispatcher()
+    with patch("app.core.config.settings.EMAIL_OUTBOX_POLL_SECONDS", 0.05):
+        dispatcher.start()
+        try:
+            # Let the dispatcher find nothing to send a few times
+            await asyncio.sleep(0.3)
+            assert dispatcher._task is not None
+            assert not dispatcher._task.done()
+
+            queue(outbox, "late@example.com")
+            for _ in range(100):
+                if smtp_server.recipients():
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await dispatcher.close()
+
+    assert smtp_server.recipients() == ["late@example.com"]
@@ -0,0 +1,73 @@
+import logging
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlmodel import Session, select
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.db import engine
+from app.core.queries import QueryStatsMiddleware
+from app.models import Item
+
+
+def read_items_one_by_one(_request: Request) -> PlainTextResponse:
+    with Session(engine) as session:
+        for _ in range(3):
+            session.exec(select(Item).limit(1)).all()
+        session.exec(select(Item.item_id).limit(1)).all()
+    return PlainTextResponse("ok")
+
+
+app = Starlette(routes=[Route("/items", read_items_one_by_one)])
+app.add_middleware(QueryStatsMiddleware)
+
+
+def test_server_timing_counts_queries() -> None:
+    with TestClient(app) as client:
+        r = client.get("/items")
+    db_timing, app_timing = r.headers["server-timing"].split(", ")
+    assert db_timing.startswith("db;dur=")
+    assert db_timing.endswith(';desc="4 queries"')
+    assert app_timing.startswith("app;dur=")
+
+
+def test_repeated_statements_logged(caplog: pytest.LogCaptureFixture) -> None:
+    with (
+        patch("app.core.config.settings.QUERY_DEBUG", True),
+        patch("app.core.config.settings.QUERY_DEBUG_REPEATS", 3),
+        caplog.at_level(logging.WARNING, logger="app.core.queries"),
+        TestClient(app) as client,
+    ):
+        client.get("/items")
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert message.startswith("Possible N+1: GET /items ran this statement 3 times")
+    assert "FROM item" in message
+
+
+def test_repeated_statements_not_tracked_by_default(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    with (
+        patch("app.core.config.settings.QUERY_DEBUG_REPEATS", 3),
+        caplog.at_level(logging.WARNING, logger="app.core.queries"),
+        TestClient(app) as client,
+    ):
+        client.get("/items")
+    assert caplog.records == []
+
+
+def test_failed_statement_leaves_no_start_time() -> None:
+    with engine.connect() as conn:
+        with pytest.raises(ProgrammingError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        assert "query_started_at" not in conn.info
+        conn.rollback()
+        conn.execute(text("SELECT 1"))
+        assert "query_started_at" not in conn.info
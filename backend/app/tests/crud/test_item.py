@@ -0,0 +1,165 @@
+import asyncio
+import uuid
+from typing import Any
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud, crud_async
+from app.api.routes.items import ITEMS_ORDER_BY
+from app.core.db import async_engine
+from app.core.events import broker
+from app.models import Item, ItemCreate, ItemEvent, ItemFilters, ItemTake
+from app.tests.utils.item import create_random_item
+from app.tests.utils.user import create_random_user
+
+
+@pytest.mark.anyio
+async def test_take_item_race_has_one_winner(db: Session) -> None:
+    item = create_random_item(db)
+    users = [create_random_user(db) for _ in range(10)]
+    start = asyncio.Event()
+
+    async def take(user_id: object) -> bool:
+        # One session, hence one connection, per taker so the updates really race
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            await start.wait()
+            taken = await crud_async.take_item(
+                session=session,
+                item_id=item.item_id,
+                user_id=user_id,  # type: ignore[arg-type]
+                item_take=ItemTake(),
+            )
+            return taken is not None
+
+    tasks = [asyncio.create_task(take(user.user_id)) for user in users]
+    await asyncio.sleep(0)
+    start.set()
+    results = await asyncio.gather(*tasks)
+
+    assert results.count(True) == 1
+    db.refresh(item)
+    winner = users[results.index(True)]
+    assert item.current_owner_id == winner.user_id
+    assert not item.is_available
+    assert item.taken_at is not None
+
+
+@pytest.mark.anyio
+async def test_release_item_only_by_owner(db: Session) -> None:
+    item = create_random_item(db)
+    owner = create_random_user(db)
+    other = create_random_user(db)
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        assert await crud_async.take_item(
+            session=session,
+            item_id=item.item_id,
+            user_id=owner.user_id,
+            item_take=ItemTake(current_room="101"),
+        )
+        assert not await crud_async.release_item(
+            session=session, item_id=item.item_id, user_id=other.user_id
+        )
+        released = await crud_async.release_item(
+            session=session, item_id=item.item_id, user_id=owner.user_id
+        )
+    assert released
+    assert released.is_available
+    assert released.current_owner_id is None
+    assert released.current_room == "101"
+
+
+@pytest.mark.anyio
+async def test_item_events_published_on_commit(db: Session) -> None:
+    item = create_random_item(db)
+    user = create_random_user(db)
+    room = f"room-{uuid.uuid4()}"
+    try:
+        in_room = await broker.subscribe(room=room)
+        elsewhere = await broker.subscribe(room=f"room-{uuid.uuid4()}")
+        of_user = await broker.subscribe(user_id=user.user_id)
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            # Rolled back as one item doesn't exist, so nothing is published
+            assert not await crud_async.take_items(
+                session=session,
+                item_ids=[item.item_id, uuid.uuid4()],
+                user_id=user.user_id,
+                item_take=ItemTake(current_room=room),
+                atomic=True,
+            )
+            assert await crud_async.take_item(
+                session=session,
+                item_id=item.item_id,
+                user_id=user.user_id,
+                item_take=ItemTake(current_room=room),
+            )
+
+        frame = await asyncio.wait_for(in_room.queue.get(), timeout=5)
+        assert frame
+        assert frame.startswith(b"event: taken\n")
+        event = ItemEvent.model_validate_json(frame.split(b"data: ")[1])
+        assert event.item_id == item.item_id
+        assert event.user_id == user.user_id
+        assert not event.is_available
+        assert in_room.queue.empty()
+        assert of_user.queue.get_nowait() == frame
+        assert elsewhere.queue.empty()
+    finally:
+        await broker.close()
+
+
+def _explain(db: Session, statement: Any) -> str:
+    sql = statement.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    # The test table is tiny, so only fall back to seq scans without an index
+    db.exec(text("SET LOCAL enable_seqscan = off"))  # type: ignore[call-overload]
+    plan = "\n".join(db.exec(text(f"EXPLAIN {sql}")).scalars())  # type: ignore[call-overload]
+    db.rollback()
+    return plan
+
+
+@pytest.mark.parametrize(
+    ("filters", "index"),
+    [
+        (ItemFilters(current_owner_id=uuid.uuid4()), "ix_item_current_owner_id"),
+        (ItemFilters(current_room="101"), "ix_item_current_room"),
+        (ItemFilters(table_name="A"), "ix_item_table_name"),
+        (ItemFilters(system_name="microscope"), "ix_item_system_name"),
+        (ItemFilters(is_available=True), "ix_item_available_item_name_item_id"),
+        (ItemFilters(is_available=False), "ix_item_taken_item_name_item_id"),
+    ],
+)
+def test_item_filters_use_an_index(
+    db: Session, filters: ItemFilters, index: str
+) -> None:
+    where = crud.item_filters(filters)
+    count_plan = _explain(db, select(func.count()).select_from(Item).where(*where))
+    assert index in count_plan, count_plan
+    page = select(Item).where(*where).order_by(*ITEMS_ORDER_BY).limit(100)
+    page_plan = _explain(db, page)
+    assert "Seq Scan" not in page_plan, page_plan
+
+
+@pytest.mark.anyio
+async def test_insert_items_publishes_one_event_per_room() -> None:
+    room = f"room-{uuid.uuid4()}"
+    items_in = [ItemCreate(item_name=f"Probe {i}", current_room=room) for i in range(3)]
+    items_in.append(ItemCreate(item_name="Scope", current_room=f"room-{uuid.uuid4()}"))
+    try:
+        in_room = await broker.subscribe(room=room)
+        async with AsyncSession(async_engine) as session:
+            await crud_async.insert_items(session=session, items_in=items_in)
+            await session.commit()
+
+        frame = await asyncio.wait_for(in_room.queue.get(), timeout=5)
+        assert frame
+        assert frame.startswith(b"event: bulk_created\n")
+        event = ItemEvent.model_validate_json(frame.split(b"data: ")[1])
+        assert event.count == 3
+        assert event.item_id is None
+        assert in_room.queue.empty()
+    finally:
+        await broker.close()
@@ -1,7 +1,14 @@
+from typing import Any
+
+import pytest
 from fastapi.encoders import jsonable_encoder
+from passlib.context import CryptContext
+from sqlalchemy import event
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app import crud
+from app import crud, crud_async
+from app.core.db import async_engine, engine
 from app.core.security import verify_password
 from app.models import User, UserCreate, UserUpdate
 from app.tests.utils.utils import random_email, random_lower_string
@@ -33,6 +40,22 @@ def test_not_authenticate_user(db: Session) -> None:
     assert user is None
 
 
+def test_authenticate_user_upgrades_hash(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    legacy_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    user.hashed_password = legacy_context.hash(password)
+    db.add(user)
+    db.commit()
+    authenticated_user = crud.authenticate(session=db, email=email, password=password)
+    assert authenticated_user
+    db.refresh(user)
+    assert user.hashed_password.startswith("$argon2id$")
+    assert verify_password(password, user.hashed_password)
+
+
 def test_check_if_user_is_active(db: Session) -> None:
     email = random_email()
     password = random_lower_string()
@@ -89,3 +112,77 @@ def test_update_user(db: Session) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+def test_count_rows_strategies(db: Session) -> None:
+    exact = crud.count_rows(session=db, model=User, strategy="exact")
+    assert crud.count_rows(session=db, model=User, strategy="cached") == exact
+    # Tables below COUNT_ESTIMATE_MIN_ROWS are counted exactly
+    assert crud.count_rows(session=db, model=User, strategy="estimated") == exact
+
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    crud.create_user(session=db, user_create=user_in)
+    assert crud.count_rows(session=db, model=User, strategy="cached") == exact + 1
+
+
+@pytest.mark.anyio
+async def test_authenticate_user_async(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    async with AsyncSession(async_engine) as session:
+        authenticated_user = await crud_async.authenticate(
+            session=session, email=email, password=password
+        )
+        assert authenticated_user
+        assert authenticated_user.user_id == user.user_id
+        assert not await crud_async.authenticate(
+            session=session, email=email, password=random_lower_string()
+        )
+
+
+def test_get_user_cached(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    crud.invalidate_user(user.user_id)
+    with Session(engine) as session:
+        assert crud.get_user(session=session, user_id=user.user_id)
+
+    statements: list[str] = []
+
+    def count_statement(*args: Any) -> None:
+        statements.append(args[2])
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        with Session(engine) as session:
+            cached_user = crud.get_user(session=session, user_id=user.user_id)
+            assert cached_user
+            assert cached_user.email == user.email
+            assert session.get(User, user.user_id) is cached_user
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    assert statements == []
+    # The password hash isn't cached, it's loaded when used
+    cached = crud.user_cache.get(str(user.user_id))
+    assert cached
+    assert "hashed_password" not in cached
+    with Session(engine) as session:
+        cached_user = crud.get_user(session=session, user_id=user.user_id)
+        assert cached_user
+        assert cached_user.hashed_password == user.hashed_password
+
+
+def test_update_user_invalidates_cache(db: Session) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    with Session(engine) as session:
+        crud.get_user(session=session, user_id=user.user_id)
+    crud.update_user(
+        session=db, db_user=user, user_in=UserUpdate(full_name="Updated Name")
+    )
+    with Session(engine) as session:
+        cached_user = crud.get_user(session=session, user_id=user.user_id)
+        assert cached_user
+        assert cached_user.full_name == "Updated Name"
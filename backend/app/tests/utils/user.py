@@ -27,6 +27,25 @@ def create_random_user(db: Session) -> User:
     return user
 
 
+def lab_user_authentication_headers(
+    *, client: TestClient, db: Session
+) -> dict[str, str]:
+    """
+    Return a valid token for a new lab member allowed to edit items and labs.
+    """
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(
+        email=email,
+        password=password,
+        is_part_of_lab=True,
+        can_edit_items=True,
+        can_edit_labs=True,
+    )
+    crud.create_user(session=db, user_create=user_in)
+    return user_authentication_headers(client=client, email=email, password=password)
+
+
 def authentication_token_from_email(
     *, client: TestClient, email: str, db: Session
 ) -> dict[str, str]:
@@ -42,7 +61,7 @@ def authentication_token_from_email(
         user = crud.create_user(session=db, user_create=user_in_create)
     else:
         user_in_update = UserUpdate(password=password)
-        if not user.id:
+        if not user.user_id:
             raise Exception("User id not set")
         user = crud.update_user(session=db, db_user=user, user_in=user_in_update)
 
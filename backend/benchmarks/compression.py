@@ -0,0 +1,106 @@
+"""
+Measure the bytes and latency trade-off of compressing GET /items/?limit=1000.
+
+Seeds at least `--items` items, then fetches the page through the app,
+in-process, once per encoding (identity, gzip, br, zstd), and reports the
+bytes on the wire, p50/p95 latency on the server side, and an estimate of
+the total time at a few link speeds (latency + bytes / bandwidth).
+
+Compression levels come from the COMPRESSION_* settings, so levels can be
+compared by running the benchmark with different environment variables:
+
+    COMPRESSION_GZIP_LEVEL=9 python -m benchmarks.compression
+
+Run from `./backend/` against a migrated database:
+
+    python -m benchmarks.compression --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from typing import Any
+
+import httpx
+
+from app.api.deps import get_current_principal
+from app.core.compression import available_encodings
+from app.core.config import settings
+from app.main import app
+from app.models import Principal
+from benchmarks.item_search import seed_items
+
+# Mbit/s: mobile, home broadband, datacenter
+BANDWIDTHS = {"10mbps": 10, "100mbps": 100, "1gbps": 1000}
+
+
+async def run(encoding: str, *, limit: int, requests: int) -> dict[str, Any]:
+    url = f"{settings.API_V1_STR}/items/"
+    transport = httpx.ASGITransport(app=app)
+    latencies: list[float] = []
+    sizes: set[int] = set()
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://bench",
+        headers={"Accept-Encoding": encoding},
+    ) as client:
+        # First request warms up connections and caches
+        for _ in range(requests + 1):
+            start = time.perf_counter()
+            async with client.stream("GET", url, params={"limit": limit}) as response:
+                response.raise_for_status()
+                # Raw bytes, as sent, not decoded
+                body = b"".join([chunk async for chunk in response.aiter_raw()])
+            latencies.append(time.perf_counter() - start)
+            sizes.add(len(body))
+            assert response.headers.get("content-encoding", "identity") == encoding
+    latencies = sorted(latencies[1:])
+    size = max(sizes)
+    p50 = statistics.median(latencies)
+    result: dict[str, Any] = {
+        "encoding": encoding,
+        "bytes": size,
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+    for name, mbps in BANDWIDTHS.items():
+        result[f"total_{name}_ms"] = round((p50 + size * 8 / (mbps * 1e6)) * 1000, 2)
+    return result
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    seed_items(args.items)
+    # List as a lab member without going through login
+    app.dependency_overrides[get_current_principal] = lambda: Principal(
+        user_id=uuid.uuid4(), is_part_of_lab=True
+    )
+    encodings = ["identity", *reversed(available_encodings(["zstd", "br", "gzip"]))]
+    identity_bytes = None
+    for encoding in encodings:
+        result = await run(encoding, limit=args.limit, requests=args.requests)
+        identity_bytes = identity_bytes or result["bytes"]
+        result["ratio"] = round(identity_bytes / result["bytes"], 2)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{encoding:<9} {result['bytes']:>8} bytes (x{result['ratio']})  "
+                f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  total at "
+                + "  ".join(
+                    f"{name}={result[f'total_{name}_ms']}ms" for name in BANDWIDTHS
+                )
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Compare requests per second of the sync (threadpool) and async (event loop)
+database stacks under the same concurrency.
+
+Both endpoints run the same query, the first page of items, one through
+`SessionDep` in a sync route and one through `AsyncSessionDep` in an async
+route. Requests are driven in-process through an ASGI transport, so the
+numbers compare the two stacks rather than the network.
+
+Run from `./backend/` against a migrated database:
+
+    python -m benchmarks.db_stack --requests 2000 --concurrency 10 40
+
+Requests that fail, such as pool checkout timeouts once the concurrency
+outgrows the connection pool, are reported as errors instead of latencies.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any
+
+import httpx
+from fastapi import FastAPI
+from sqlmodel import select
+
+from app.api.deps import AsyncSessionDep, SessionDep
+from app.models import Item
+
+bench_app = FastAPI()
+
+
+@bench_app.get("/sync")
+def sync_items(session: SessionDep) -> int:
+    return len(session.exec(select(Item).limit(100)).all())
+
+
+@bench_app.get("/async")
+async def async_items(session: AsyncSessionDep) -> int:
+    return len((await session.exec(select(Item).limit(100))).all())
+
+
+async def run(path: str, *, requests: int, concurrency: int) -> dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+    transport = httpx.ASGITransport(app=bench_app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one() -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                if response.is_success:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    # e.g. pool checkout timeouts once concurrency outgrows the pool
+                    errors += 1
+
+        # Warm up the connection pools before measuring
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        latencies.clear()
+        errors = 0
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "stack": path.strip("/"),
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p95_ms": (
+            round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2)
+            if latencies
+            else None
+        ),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 40])
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        for path in ("/sync", "/async"):
+            result = await run(path, requests=args.requests, concurrency=concurrency)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(
+                    f"{result['stack']:>5}  c={concurrency:<4} "
+                    f"{result['rps']:>8} req/s  "
+                    f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  "
+                    f"errors={result['errors']}"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,219 @@
+"""
+Load test GET /items/events with thousands of idle subscribers on one worker.
+
+Starts the app under uvicorn with a single worker, opens `--subscribers`
+event streams, then reports the worker's memory per subscriber, its CPU use
+while the streams are idle, how many database connections it holds, and how
+long each published event takes to reach every subscriber.
+
+Run from `./backend/` against a migrated database:
+
+    python -m benchmarks.item_events --subscribers 5000 --events 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import timedelta
+from typing import Any
+
+import httpx
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.events import CHANNEL
+from app.core.security import create_access_token
+from app.models import ItemEvent, User, UserCreate
+
+BENCH_EMAIL = "events-bench@example.com"
+
+
+def bench_token() -> str:
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=BENCH_EMAIL)
+        if user is None:
+            user = crud.create_user(
+                session=session,
+                user_create=UserCreate(
+                    email=BENCH_EMAIL,
+                    password=uuid.uuid4().hex,
+                    is_part_of_lab=True,
+                    is_superuser=True,
+                ),
+            )
+        assert isinstance(user, User)
+        return create_access_token(user.user_id, timedelta(hours=1))
+
+
+def publish(event: ItemEvent) -> None:
+    with engine.begin() as connection:
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": CHANNEL, "payload": event.model_dump_json()},
+        )
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("VmRSS not found")
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # utime and stime, in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class Subscriber:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, port: int, path: str, token: str) -> "Subscriber":
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: bench\r\n"
+            f"Authorization: Bearer {token}\r\nAccept: text/event-stream\r\n\r\n".encode()
+        )
+        head = await reader.readuntil(b"\r\n\r\n")
+        if not head.startswith(b"HTTP/1.1 200"):
+            raise RuntimeError(head.decode(errors="replace"))
+        await reader.readuntil(b": subscribed")
+        return cls(reader, writer)
+
+    async def wait_for(self, marker: bytes) -> float:
+        await self.reader.readuntil(marker)
+        return time.perf_counter()
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    # One socket per subscriber, on the client side and the server side
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    token = bench_token()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(args.port),
+            "--workers",
+            "1",
+            "--log-level",
+            "warning",
+            "--backlog",
+            "4096",
+        ]
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    headers = {"Authorization": f"Bearer {token}"}
+    subscribers: list[Subscriber] = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, headers=headers) as client:
+            for _ in range(100):
+                try:
+                    await client.get(f"{settings.API_V1_STR}/utils/health-check/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            # Load the app's modules and the user cache before measuring memory
+            await client.get(f"{settings.API_V1_STR}/users/me")
+            rss_before = rss_mb(server.pid)
+
+            semaphore = asyncio.Semaphore(args.connect_concurrency)
+            path = f"{settings.API_V1_STR}/items/events"
+
+            async def subscribe() -> None:
+                async with semaphore:
+                    subscribers.append(await Subscriber.open(args.port, path, token))
+
+            start = time.perf_counter()
+            await asyncio.gather(*(subscribe() for _ in range(args.subscribers)))
+            connect_seconds = time.perf_counter() - start
+            await asyncio.sleep(1)
+            rss_after = rss_mb(server.pid)
+
+            cpu_start = cpu_seconds(server.pid)
+            await asyncio.sleep(args.idle_seconds)
+            idle_cpu = (cpu_seconds(server.pid) - cpu_start) / args.idle_seconds
+
+            pools = (await client.get(f"{settings.API_V1_STR}/utils/db-pool/")).json()
+
+        latencies: list[float] = []
+        for _ in range(args.events):
+            event = ItemEvent(event="taken", item_id=uuid.uuid4(), is_available=False)
+            marker = str(event.item_id).encode()
+            waiters = [
+                asyncio.create_task(subscriber.wait_for(marker))
+                for subscriber in subscribers
+            ]
+            await asyncio.sleep(0)
+            published_at = time.perf_counter()
+            await asyncio.to_thread(publish, event)
+            received = await asyncio.gather(*waiters)
+            latencies.extend(at - published_at for at in received)
+    finally:
+        # Disconnect first, the worker waits for open streams before exiting
+        await asyncio.gather(*(subscriber.close() for subscriber in subscribers))
+        server.terminate()
+        await asyncio.to_thread(server.wait, 30)
+
+    latencies.sort()
+    return {
+        "subscribers": len(subscribers),
+        "connect_seconds": round(connect_seconds, 2),
+        "rss_mb": round(rss_after, 1),
+        "kb_per_subscriber": round(
+            (rss_after - rss_before) * 1024 / max(len(subscribers), 1), 1
+        ),
+        "idle_cpu_percent": round(idle_cpu * 100, 2),
+        "db_connections_checked_out": sum(pool["checked_out"] for pool in pools),
+        "events": args.events,
+        "delivery_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "delivery_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "delivery_max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--idle-seconds", type=float, default=10)
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key:<28} {value}")
+
+
+if __name__ == "__main__":
+    main()
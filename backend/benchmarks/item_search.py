@@ -0,0 +1,169 @@
+"""
+Measure GET /items/search latency over a large inventory.
+
+Seeds the item table up to `--items` rows of generated lab equipment (500k by
+default, skipped when the table is already that big), then runs a mix of
+prefix, multi-word and misspelled queries through the app, in-process, and
+reports p50/p95 per query against `--target-ms`.
+
+Ranking has to score every match, so broad one-word prefixes cost more than
+the selective queries the search is meant for.
+
+Run from `./backend/` against a migrated database (pg_trgm is required):
+
+    python -m benchmarks.item_search --items 500000 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+import uuid
+from typing import Any
+
+import httpx
+from sqlalchemy import func, insert, text
+from sqlmodel import Session, select
+
+from app.api.deps import get_current_principal
+from app.core.config import settings
+from app.core.db import engine
+from app.main import app
+from app.models import Item, Principal
+
+# The app configures INFO logging, which would log every benchmark request
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+KINDS = [
+    "oscilloscope",
+    "multimeter",
+    "power supply",
+    "signal generator",
+    "spectrum analyzer",
+    "soldering station",
+    "logic analyzer",
+    "microscope",
+    "probe",
+    "cable",
+    "resistor kit",
+    "capacitor kit",
+    "breadboard",
+    "thermal camera",
+    "function generator",
+]
+VENDORS = ["Rigol", "Keysight", "Fluke", "Tektronix", "Siglent", "Hakko", "Weller"]
+PARAMS = [
+    "100 MHz",
+    "4 channels",
+    "6000 counts",
+    "30 V 5 A",
+    "USB",
+    "True RMS",
+    "10 uF",
+]
+# Typical lookups (model numbers, vendor + kind, typos), then broad prefixes
+# matching a large share of the table, which must rank every match
+QUERIES = [
+    "oscilloscope 4821",
+    "keysight probe 12",
+    "multimetr 5077",
+    "rigol oscillo",
+    "cable",
+]
+
+
+def seed_items(total: int, *, batch_size: int = 10_000) -> int:
+    """
+    Insert generated items until the table holds `total` rows. Returns how
+    many were inserted.
+    """
+    rng = random.Random(42)
+    with Session(engine) as session:
+        existing = session.exec(select(func.count()).select_from(Item)).one()
+    missing = max(total - existing, 0)
+    inserted = 0
+    with engine.begin() as connection:
+        while inserted < missing:
+            rows = [
+                {
+                    "item_id": uuid.uuid4(),
+                    "item_name": f"{rng.choice(KINDS)} {rng.randrange(1000, 9999)}",
+                    "item_vendor": rng.choice(VENDORS),
+                    "item_params": ", ".join(rng.sample(PARAMS, 2)),
+                    "is_available": rng.random() < 0.8,
+                }
+                for _ in range(min(batch_size, missing - inserted))
+            ]
+            connection.execute(insert(Item), rows)
+            inserted += len(rows)
+        # Fresh statistics, or the planner may not pick the search indexes
+        connection.execute(text("ANALYZE item"))
+    return inserted
+
+
+async def run(query: str, *, requests: int, concurrency: int) -> dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    url = f"{settings.API_V1_STR}/items/search"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one() -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url, params={"q": query, "limit": 20})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        # Warm up connections and caches before measuring
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        latencies.clear()
+        await asyncio.gather(*(one() for _ in range(requests)))
+
+    latencies.sort()
+    return {
+        "query": query,
+        "requests": requests,
+        "concurrency": concurrency,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=500_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--target-ms", type=float, default=20)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    inserted = seed_items(args.items)
+    if not args.json:
+        print(f"seeded {inserted} items in {time.perf_counter() - start:.1f}s")
+
+    # Search as a lab member without going through login
+    app.dependency_overrides[get_current_principal] = lambda: Principal(
+        user_id=uuid.uuid4(), is_part_of_lab=True
+    )
+    for query in QUERIES:
+        result = await run(query, requests=args.requests, concurrency=args.concurrency)
+        result["within_target"] = result["p95_ms"] <= args.target_ms
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{query!r:<22} p50={result['p50_ms']}ms  p95={result['p95_ms']}ms"
+                f"{'' if result['within_target'] else '  OVER TARGET'}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
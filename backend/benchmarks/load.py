@@ -0,0 +1,530 @@
+"""
+Load test the lab API with realistic scenarios and save the results as JSON.
+
+Scenarios, each run in turn by `--concurrency` virtual users for `--duration`
+seconds, every user logged in as its own lab member:
+
+- login: the login storm at the start of a session, against the hashing pool
+- browse: list items, page through them by cursor and open one
+- hot-items: take and release a few items all users compete for, conflicts
+  (409) are expected
+- rooms: create, read, update and delete a room
+- export: download every item as CSV or JSON Lines
+
+Before running, seeds the database up to `--users` lab members, `--items`
+items and `--rooms` rooms (rows already there count), straight through the
+engine, so runs of different sizes can share a database.
+
+Requests go through the app in-process by default. Pass `--base-url` to load
+a running server instead, such as the docker compose stack, the database is
+still seeded through the POSTGRES_* settings:
+
+    docker compose up -d
+    python -m benchmarks.load --base-url http://localhost:8000 --output run.json
+
+Run from `./backend/` against a migrated database. Compare with a previous
+run's results:
+
+    python -m benchmarks.load --output new.json --baseline old.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import subprocess
+import time
+import uuid
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timezone
+from typing import Any
+
+import httpx
+import jwt
+from sqlalchemy import func, insert, update
+from sqlmodel import Session, col, select
+
+from app.core import security
+from app.core.config import settings
+from app.core.db import engine
+from app.main import app
+from app.models import Item, Room, User
+from benchmarks.item_search import seed_items
+
+# The app configures INFO logging, which would log every benchmark request
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BENCH_PASSWORD = "load-bench-password"
+BENCH_EMAIL = "load-bench-{}@example.com"
+# Refresh access tokens this long before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+
+def seed_users(total: int) -> list[str]:
+    """
+    Make sure lab members `BENCH_EMAIL` 0 to `total` - 1 exist. Returns their
+    emails.
+    """
+    emails = [BENCH_EMAIL.format(i) for i in range(total)]
+    with Session(engine) as session:
+        existing = set(
+            session.exec(select(User.email).where(col(User.email).in_(emails))).all()
+        )
+    missing = [email for email in emails if email not in existing]
+    if missing:
+        # Hashed once, hashing per user would take longer than the run
+        hashed_password = security.get_password_hash(BENCH_PASSWORD)
+        now = datetime.utcnow()
+        with engine.begin() as connection:
+            connection.execute(
+                insert(User),
+                [
+                    {
+                        "user_id": uuid.uuid4(),
+                        "email": email,
+                        "hashed_password": hashed_password,
+                        "is_active": True,
+                        "is_superuser": False,
+                        "is_part_of_lab": True,
+                        "can_edit_items": True,
+                        "can_edit_labs": True,
+                        "can_edit_users": False,
+                        "updated_at": now,
+                    }
+                    for email in missing
+                ],
+            )
+    return emails
+
+
+def seed_rooms(total: int) -> int:
+    with Session(engine) as session:
+        existing = session.exec(select(func.count()).select_from(Room)).one()
+    missing = max(total - existing, 0)
+    if missing:
+        now = datetime.utcnow()
+        with engine.begin() as connection:
+            connection.execute(
+                insert(Room),
+                [
+                    {
+                        "room_id": uuid.uuid4(),
+                        "room_number": f"R{i:04d}",
+                        "room_place": f"Building {i % 5}",
+                        "updated_at": now,
+                    }
+                    for i in range(existing, total)
+                ],
+            )
+    return missing
+
+
+def reset_hot_items(count: int) -> list[str]:
+    """
+    The first `count` items, made available again in case a previous run
+    stopped while holding them.
+    """
+    with Session(engine) as session:
+        item_ids = session.exec(
+            select(Item.item_id).order_by(col(Item.item_id)).limit(count)
+        ).all()
+        session.exec(  # type: ignore[call-overload]
+            update(Item)
+            .where(col(Item.item_id).in_(item_ids))
+            .values(is_available=True, current_owner_id=None, taken_at=None)
+        )
+        session.commit()
+    return [str(item_id) for item_id in item_ids]
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    # Nearest rank, of latencies already sorted
+    return latencies[max(math.ceil(len(latencies) * q) - 1, 0)]
+
+
+class Recorder:
+    """
+    Latencies and response statuses by operation. Statuses outside of an
+    operation's `expected` ones, and requests that failed, count as errors.
+    """
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {}
+        self.statuses: dict[str, Counter[str]] = {}
+        self.errors = 0
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        operation: str,
+        method: str,
+        url: str,
+        *,
+        expected: tuple[int, ...] = (200,),
+        **kwargs: Any,
+    ) -> httpx.Response | None:
+        statuses = self.statuses.setdefault(operation, Counter())
+        start = time.perf_counter()
+        try:
+            # Reads the whole body, so exports are timed until their last byte
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+            self.errors += 1
+            return None
+        elapsed = time.perf_counter() - start
+        statuses[str(response.status_code)] += 1
+        if response.status_code not in expected:
+            self.errors += 1
+            return None
+        self.latencies.setdefault(operation, []).append(elapsed)
+        return response
+
+    def summary(self) -> dict[str, Any]:
+        operations = {}
+        for operation, statuses in self.statuses.items():
+            latencies = sorted(self.latencies.get(operation, []))
+            result: dict[str, Any] = {
+                "requests": sum(statuses.values()),
+                "statuses": dict(statuses),
+            }
+            if latencies:
+                result |= {
+                    "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+                    "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                    "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                    "max_ms": round(latencies[-1] * 1000, 2),
+                }
+            operations[operation] = result
+        return operations
+
+
+class Credentials:
+    """
+    A bench user's tokens. The access token is refreshed through
+    /login/refresh-token shortly before it expires, so runs can outlast
+    ACCESS_TOKEN_EXPIRE_MINUTES. Refreshes aren't recorded.
+    """
+
+    def __init__(self, tokens: dict[str, Any]) -> None:
+        self._update(tokens)
+
+    def _update(self, tokens: dict[str, Any]) -> None:
+        self.access_token: str = tokens["access_token"]
+        self.refresh_token: str = tokens["refresh_token"]
+        # The server checks the signature, only the expiry is needed here
+        claims = jwt.decode(self.access_token, options={"verify_signature": False})
+        self.expires_at: float = claims["exp"]
+
+    async def headers(self, client: httpx.AsyncClient) -> dict[str, str]:
+        if time.time() >= self.expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+            response = await client.post(
+                "/login/refresh-token", json={"refresh_token": self.refresh_token}
+            )
+            response.raise_for_status()
+            self._update(response.json())
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+
+class VirtualUser:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        recorder: Recorder,
+        rng: random.Random,
+        *,
+        email: str,
+        credentials: Credentials,
+        context: dict[str, Any],
+    ) -> None:
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.email = email
+        self.credentials = credentials
+        self.context = context
+
+    async def request(
+        self, operation: str, method: str, url: str, **kwargs: Any
+    ) -> httpx.Response | None:
+        if "headers" not in kwargs:
+            kwargs["headers"] = await self.credentials.headers(self.client)
+        return await self.recorder.request(
+            self.client, operation, method, url, **kwargs
+        )
+
+
+async def login(user: VirtualUser) -> None:
+    # 429 is the hashing pool's back-pressure, not a failure
+    await user.request(
+        "login",
+        "POST",
+        "/login/access-token",
+        data={"username": user.email, "password": BENCH_PASSWORD},
+        headers={},
+        expected=(200, 429),
+    )
+
+
+async def browse(user: VirtualUser) -> None:
+    params: dict[str, Any] = {"limit": 50}
+    seen: list[str] = []
+    for page in range(3):
+        # Only the first page asks for the total count, like the frontend
+        params["include_count"] = page == 0
+        response = await user.request("list-items", "GET", "/items/", params=params)
+        if response is None:
+            return
+        content = response.json()
+        seen.extend(item["item_id"] for item in content["data"])
+        if content["next_cursor"] is None:
+            break
+        params["cursor"] = content["next_cursor"]
+    if seen:
+        await user.request("read-item", "GET", f"/items/{user.rng.choice(seen)}")
+
+
+async def hot_items(user: VirtualUser) -> None:
+    item_id = user.rng.choice(user.context["hot_items"])
+    response = await user.request(
+        "take-item", "PUT", f"/items/{item_id}/take", json={}, expected=(200, 409)
+    )
+    if response is not None and response.status_code == 200:
+        await user.request("release-item", "PUT", f"/items/{item_id}/release")
+
+
+async def rooms(user: VirtualUser) -> None:
+    response = await user.request(
+        "create-room",
+        "POST",
+        "/rooms/",
+        json={"room_number": f"L{user.rng.randrange(10_000)}", "room_place": "Load"},
+    )
+    if response is None:
+        return
+    url = f"/rooms/{response.json()['room_id']}"
+    await user.request("read-room", "GET", url)
+    await user.request("update-room", "PUT", url, json={"room_place": "Load 2"})
+    await user.request("delete-room", "DELETE", url)
+
+
+async def export(user: VirtualUser) -> None:
+    fmt = user.rng.choice(["csv", "jsonl"])
+    await user.request(f"export-{fmt}", "GET", "/items/export", params={"format": fmt})
+
+
+SCENARIOS: dict[str, Callable[[VirtualUser], Awaitable[None]]] = {
+    "login": login,
+    "browse": browse,
+    "hot-items": hot_items,
+    "rooms": rooms,
+    "export": export,
+}
+
+
+async def run_scenario(
+    scenario: Callable[[VirtualUser], Awaitable[None]],
+    users: list[VirtualUser],
+    *,
+    duration: float,
+) -> tuple[float, int]:
+    """
+    Run `scenario` in a loop for each user until `duration` is over. Returns
+    the time taken and how many iterations ran.
+    """
+    iterations = 0
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def loop(user: VirtualUser) -> None:
+        nonlocal iterations
+        while time.perf_counter() < deadline:
+            await scenario(user)
+            iterations += 1
+
+    await asyncio.gather(*(loop(user) for user in users))
+    return time.perf_counter() - start, iterations
+
+
+async def log_in(client: httpx.AsyncClient, emails: list[str]) -> list[Credentials]:
+    credentials = []
+    for email in emails:
+        response = await client.post(
+            "/login/access-token",
+            data={"username": email, "password": BENCH_PASSWORD},
+        )
+        response.raise_for_status()
+        credentials.append(Credentials(response.json()))
+    return credentials
+
+
+def git_revision() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    """
+    Lines comparing throughput and p95 latency with the same scenario and
+    operations of a baseline run.
+    """
+    previous_runs = {scenario["name"]: scenario for scenario in baseline["scenarios"]}
+    lines = []
+    for scenario in result["scenarios"]:
+        previous = previous_runs.get(scenario["name"])
+        if previous is None:
+            continue
+        rps_change = scenario["requests_per_second"] / max(
+            previous["requests_per_second"], 1e-9
+        )
+        lines.append(f"{scenario['name']:<10} throughput x{rps_change:.2f}")
+        for operation, stats in scenario["operations"].items():
+            before = previous["operations"].get(operation, {}).get("p95_ms")
+            if before and "p95_ms" in stats:
+                lines.append(
+                    f"  {operation:<14} p95 {before}ms -> {stats['p95_ms']}ms "
+                    f"(x{stats['p95_ms'] / before:.2f})"
+                )
+    return lines
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--base-url", help="load this server instead of in-process")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20, help="seconds each")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds each")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--hot-items", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this results file")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    emails = seed_users(max(args.users, args.concurrency))
+    seed_items(args.items)
+    seed_rooms(args.rooms)
+    context = {"hot_items": reset_hot_items(args.hot_items)}
+    if not args.json:
+        print(f"seeded in {time.perf_counter() - start:.1f}s")
+
+    if args.base_url:
+        transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=args.concurrency)
+        )
+        base_url = f"{args.base_url.rstrip('/')}{settings.API_V1_STR}"
+    else:
+        transport = httpx.ASGITransport(app=app)
+        base_url = f"http://bench{settings.API_V1_STR}"
+
+    result: dict[str, Any] = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "target": args.base_url or "in-process",
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "concurrency",
+                "duration",
+                "warmup",
+                "users",
+                "items",
+                "rooms",
+                "hot_items",
+                "seed",
+            )
+        },
+        "scenarios": [],
+    }
+    rng = random.Random(args.seed)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url=base_url, timeout=60
+        ) as client:
+            user_emails = rng.sample(emails, args.concurrency)
+            credentials = await log_in(client, user_emails)
+            for name in args.scenarios:
+                scenario = SCENARIOS[name]
+                recorders = (Recorder(), Recorder())
+                for recorder, duration in zip(
+                    recorders, (args.warmup, args.duration), strict=True
+                ):
+                    users = [
+                        VirtualUser(
+                            client,
+                            recorder,
+                            random.Random(rng.random()),
+                            email=email,
+                            credentials=user_credentials,
+                            context=context,
+                        )
+                        for email, user_credentials in zip(
+                            user_emails, credentials, strict=True
+                        )
+                    ]
+                    elapsed, iterations = await run_scenario(
+                        scenario, users, duration=duration
+                    )
+                # Only the measured run, after the warm up
+                recorder = recorders[1]
+                requests = sum(
+                    sum(statuses.values()) for statuses in recorder.statuses.values()
+                )
+                scenario_result = {
+                    "name": name,
+                    "seconds": round(elapsed, 2),
+                    "iterations": iterations,
+                    "requests": requests,
+                    "requests_per_second": round(requests / elapsed, 1),
+                    "errors": recorder.errors,
+                    "operations": recorder.summary(),
+                }
+                result["scenarios"].append(scenario_result)
+                if args.json:
+                    continue
+                print(
+                    f"{name:<10} {scenario_result['requests_per_second']:>8} req/s  "
+                    f"errors={recorder.errors}"
+                )
+                for operation, stats in scenario_result["operations"].items():
+                    print(
+                        f"  {operation:<14} p50={stats.get('p50_ms')}ms  "
+                        f"p95={stats.get('p95_ms')}ms  p99={stats.get('p99_ms')}ms  "
+                        f"statuses={stats['statuses']}"
+                    )
+    finally:
+        if not args.base_url:
+            security.shutdown_hashing_executor()
+
+    if args.json:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for line in compare(result, baseline):
+            print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Measure login throughput against the size of the password hashing process pool.
+
+Logs in as FIRST_SUPERUSER through the real app, in-process, for each
+PASSWORD_HASHING_WORKERS value, and reports successful logins per second,
+latency and how many requests were rejected with 429 by back-pressure.
+
+Run from `./backend/` against a migrated database with initial data:
+
+    python -m benchmarks.login_throughput --workers 1 2 4 8 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Any
+
+import httpx
+
+from app.core import security
+from app.core.config import settings
+from app.main import app
+
+# The app configures INFO logging, which would log every benchmark request
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def run(*, workers: int, requests: int, concurrency: int) -> dict[str, Any]:
+    security.shutdown_hashing_executor()
+    settings.PASSWORD_HASHING_WORKERS = workers
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    url = f"{settings.API_V1_STR}/login/access-token"
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    rejected = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one() -> None:
+            nonlocal rejected
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, data=login_data)
+                if response.status_code == 429:
+                    rejected += 1
+                    return
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        # Start the pool's processes before measuring
+        await asyncio.gather(*(one() for _ in range(workers)))
+        latencies.clear()
+        rejected = 0
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "workers": workers,
+        "concurrency": concurrency,
+        "requests": requests,
+        "rejected": rejected,
+        "logins_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": (
+            round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1)
+            if latencies
+            else None
+        ),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 4]
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    try:
+        for workers in args.workers:
+            result = await run(
+                workers=workers, requests=args.requests, concurrency=args.concurrency
+            )
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(
+                    f"workers={workers:<3} {result['logins_per_second']:>7} logins/s  "
+                    f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  "
+                    f"rejected={result['rejected']}"
+                )
+    finally:
+        security.shutdown_hashing_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+Compare the serialization cost per row of the GET /items/ page response.
+
+Serializes the same in-memory items three ways: FastAPI's default path (build
+`ItemsPublic`, validate it against the route's `response_model`, encode with
+the standard json module), that path with orjson, and the `item_serializer`
+fast path the route uses. No database is needed.
+
+Run from `./backend/`:
+
+    python -m benchmarks.serialization --rows 1 10 100 1000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections.abc import Callable, Coroutine
+from datetime import datetime
+from functools import partial
+from typing import Any
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from app.api.serialization import item_serializer
+from app.core.config import settings
+from app.main import app
+from app.models import Item, ItemsPublic
+
+
+def make_items(rows: int) -> list[Item]:
+    rng = random.Random(42)
+    return [
+        Item(
+            item_id=uuid.uuid4(),
+            item_name=f"oscilloscope {rng.randrange(1000, 9999)}",
+            current_room=f"{rng.randrange(100, 500)}",
+            table_name="A",
+            current_owner_id=uuid.uuid4(),
+            taken_at=datetime.utcnow(),
+            item_vendor="Rigol",
+            item_params="100 MHz, 4 channels",
+            is_available=False,
+        )
+        for _ in range(rows)
+    ]
+
+
+def items_route() -> APIRoute:
+    path = f"{settings.API_V1_STR}/items/"
+    for route in app.routes:
+        if (
+            isinstance(route, APIRoute)
+            and route.path == path
+            and "GET" in route.methods
+        ):
+            return route
+    raise LookupError(path)
+
+
+async def response_model_body(
+    route: APIRoute, items: list[Item], response_class: type[JSONResponse]
+) -> bytes:
+    # What FastAPI does with the `ItemsPublic` a route returns
+    content = await serialize_response(
+        field=route.response_field,
+        response_content=ItemsPublic(data=items, count=len(items)),
+        is_coroutine=True,
+    )
+    return response_class(content).body
+
+
+async def fast_path_body(items: list[Item]) -> bytes:
+    return item_serializer.page_response(items, count=len(items)).body
+
+
+async def measure(
+    serialize: Callable[[], Coroutine[Any, Any, bytes]], *, rows: int, min_rows: int
+) -> float:
+    """
+    Microseconds per row, best of 5 runs of at least `min_rows` rows each.
+    """
+    repeat = max(min_rows // rows, 1)
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await serialize()
+        best = min(best, time.perf_counter() - start)
+    return best / (repeat * rows) * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--min-rows", type=int, default=20_000)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    route = items_route()
+    for rows in args.rows:
+        items = make_items(rows)
+        # Same JSON whichever the path
+        assert json.loads(await fast_path_body(items)) == json.loads(
+            await response_model_body(route, items, JSONResponse)
+        )
+        result = {
+            "rows": rows,
+            "response_model_json_us": await measure(
+                partial(response_model_body, route, items, JSONResponse),
+                rows=rows,
+                min_rows=args.min_rows,
+            ),
+            "response_model_orjson_us": await measure(
+                partial(response_model_body, route, items, ORJSONResponse),
+                rows=rows,
+                min_rows=args.min_rows,
+            ),
+            "fast_path_us": await measure(
+                partial(fast_path_body, items), rows=rows, min_rows=args.min_rows
+            ),
+        }
+        result = {
+            key: round(value, 2) if isinstance(value, float) else value
+            for key, value in result.items()
+        }
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"rows={rows:<5} per row: response_model+json "
+                f"{result['response_model_json_us']}us  response_model+orjson "
+                f"{result['response_model_orjson_us']}us  fast path "
+                f"{result['fast_path_us']}us"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())